@@ -1,18 +1,37 @@
+import os
 import random
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
 from dash import Dash, dcc, html, Input, Output
+from dash.exceptions import PreventUpdate
+from flask import jsonify
 from pymysql.cursors import DictCursor
 
+from Backend import create_backend
+from Cache import QueryCache
+from Climatology import climatology_std, exclude_value
+from Dimensions import geohash_cell_size, geohash_cells
+from Instrumentation import instrument_server, instrumentation
 from Model import DataWarehouseManager
+from Scheduler import FetchCancelled, FetchError, FetchScheduler, install_session_cookie
+from Snapshot import SnapshotReader
+
+# Au-delà de HEATMAP_MAX_MARKERS stations visibles, la carte (mode automatique) regroupe les stations par cellule
+HEATMAP_MAX_MARKERS = int(os.environ.get('HEATMAP_MAX_MARKERS', 1000))
+DEFAULT_MAP_ZOOM = 3
+# Granularité jour : seules les LINE_DAY_YEARS dernières années avec des valeurs pour les stations choisies sont
+# lues (faits bornés même sans filtre de pays)
+LINE_DAY_YEARS = int(os.environ.get('LINE_DAY_YEARS', 5))
 
 external_stylesheets = ['https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/css/bootstrap.min.css']
 app = Dash(__name__, external_stylesheets=external_stylesheets)
+server = app.server  # Point d'entrée WSGI : gunicorn App:server
 
 
-def connect_to_data_warehouse():
+def create_data_warehouse():
     # Veuillez remplacer les valeurs suivantes par les vôtres
 
     username = 'root'
@@ -20,79 +39,330 @@ def connect_to_data_warehouse():
 
     #########################################################
 
-    warehouse = DataWarehouseManager('localhost', username, password, 'Weather_DataWarehouse', 'utf8mb4', DictCursor)
-    warehouse.connect()
-    return warehouse
+    # Aucune connexion n'est ouverte ici : les callbacks empruntent celles du pool partagé
+    return DataWarehouseManager('localhost', username, password, 'Weather_DataWarehouse', 'utf8mb4', DictCursor)
+
+
+warehouse = create_data_warehouse()
+# WAREHOUSE_BACKEND=duckdb sert les mêmes requêtes depuis l'export Parquet (WAREHOUSE_PARQUET_DIR), sans serveur
+backend = create_backend(warehouse)
+# FACT_SNAPSHOT_DIR : agrégations calculées sur l'instantané mmap des faits (Snapshot.py), rafraîchi à chaque
+# chargement ; les pages sont partagées entre les workers gunicorn par le cache du système
+snapshots = SnapshotReader(os.environ['FACT_SNAPSHOT_DIR']) if os.environ.get('FACT_SNAPSHOT_DIR') else None
+# QUERY_CACHE_DIR active le niveau disque partagé entre les workers gunicorn d'une même machine
+query_cache = QueryCache(max_entries=int(os.environ.get('QUERY_CACHE_SIZE', 256)),
+                         ttl=int(os.environ.get('QUERY_CACHE_TTL', 300)),
+                         disk_path=os.path.join(os.environ['QUERY_CACHE_DIR'], 'query_cache.sqlite3')
+                         if os.environ.get('QUERY_CACHE_DIR') else None,
+                         version_source=snapshots.load_version if snapshots else backend.load_version)
+warehouse.add_load_listener(query_cache.invalidate)
+# Durées par étape (Server-Timing, /metrics) ; PROFILE_DIR active le profilage cProfile à la demande (/profiling)
+instrument_server(server, instrumentation, os.environ.get('PROFILE_DIR'))
+# FETCH_WORKERS active les lectures en arrière-plan : pool borné, une seule requête vivante par utilisateur et
+# par graphique (les positions de curseur dépassées sont abandonnées), interruption après FETCH_TIMEOUT secondes
+fetch_scheduler = FetchScheduler(int(os.environ['FETCH_WORKERS']), int(os.environ.get('FETCH_MAX_PENDING', 32)),
+                                 float(os.environ.get('FETCH_TIMEOUT', 30))) if os.environ.get('FETCH_WORKERS') else None
+if fetch_scheduler is not None:
+    install_session_cookie(server)
+
+
+def run_query(query, span_name='query'):
+    with instrumentation.span(span_name, sql=query) as span:
+        rows = backend.query(query)
+        span['rows'] = len(rows)
+    return rows
+
+
+def run_query_frame(query, span_name='query'):
+    # Résultats volumineux : colonnes typées (float32, catégories) sans passer par un dictionnaire par ligne
+    with instrumentation.span(span_name, sql=query) as span:
+        df = backend.query_frame(query)
+        span['rows'] = len(df)
+        span['nbytes'] = df.memory_usage(index=False).sum()
+    return df
+
+
+def current_snapshot():
+    return snapshots.current() if snapshots is not None else None
+
+
+def run_snapshot(span_name, method, *args):
+    # Réductions vectorisées sur des tranches sans copie de l'instantané, à la place de la requête SQL
+    with instrumentation.span(span_name) as span:
+        df = method(*args)
+        span['rows'] = len(df)
+        span['nbytes'] = df.memory_usage(index=False).sum()
+    return df
+
+
+def fetch(channel, func, *args):
+    if fetch_scheduler is None:
+        return func(*args)
+    try:
+        return fetch_scheduler.run(channel, func, *args)
+    except FetchCancelled:
+        # Entrée dépassée par une plus récente : la figure sera mise à jour par la dernière requête
+        raise PreventUpdate
+
+
+def unavailable_figure(error):
+    fig = go.Figure()
+    fig.add_annotation(text=f"Données indisponibles : {error}", showarrow=False, xref='paper', yref='paper',
+                       x=0.5, y=0.5)
+    return fig
+
+
+@server.route('/metrics/pool')
+def pool_metrics():
+    return jsonify(warehouse.pool_metrics())
+
+
+@server.route('/metrics/cache')
+def cache_metrics():
+    return jsonify(query_cache.stats())
+
+
+@server.route('/metrics/fetch')
+def fetch_metrics():
+    return jsonify(fetch_scheduler.stats() if fetch_scheduler is not None else {'enabled': False})
+
+
+@server.route('/metrics/slow-queries')
+def slow_query_log():
+    return jsonify(list(instrumentation.slow_queries))
+
+
+@server.route('/metrics')
+def prometheus_metrics():
+    # Spans au format Prometheus, complétés par les compteurs du cache et du pool de connexions
+    gauges = {f'query_cache_{name}': value for name, value in query_cache.stats().items()
+              if isinstance(value, (int, float))}
+    if backend.name == 'mysql':
+        gauges.update({f'warehouse_pool_{name}': value for name, value in warehouse.pool_metrics().items()
+                       if isinstance(value, (int, float))})
+    if fetch_scheduler is not None:
+        gauges.update({f'fetch_{name}': value for name, value in fetch_scheduler.stats().items()})
+    return server.response_class(instrumentation.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
 
 
 def fetch_years():
-    cursor = connect_to_data_warehouse().get_cursor()
-    query = "SELECT year FROM DateDim"
-    cursor.execute(query)
-    years = cursor.fetchall()
-    years_list = sorted(set(year['year'] for year in years))
+    years_list = fetch_dimension_metadata()['years']
     # Generate a list of years with steps of 5
     return [year for year in years_list if year % 5 == 0]
 
 
-def fetch_data_heatmap(parameter, year_range, month_range):
-    cursor = connect_to_data_warehouse().get_cursor()
+@query_cache.cached
+def fetch_dimension_index():
+    # StationDim et DateDim en tableaux triés, partagés jusqu'au prochain chargement : les requêtes filtrent
+    # sur des identifiants entiers et les attributs sont rattachés en mémoire au lieu d'une jointure
+    snapshot = current_snapshot()
+    return snapshot.dimension_index() if snapshot is not None else backend.dimension_index()
+
+
+def id_filter(column, ids):
+    if ids is None:
+        return ""
+    if not len(ids):
+        return "AND 1 = 0"
+    return f"AND {column} IN ({', '.join(str(int(value)) for value in ids)})"
+
+
+def id_range_filter(column, ranges):
+    if ranges is None:
+        return ""
+    if not ranges:
+        return "AND 1 = 0"
+    return "AND (" + " OR ".join(f"{column} BETWEEN {first} AND {last}" for first, last in ranges) + ")"
+
+
+def average_by(df, keys):
+    # Moyenne exacte à partir des sommes et effectifs par station : SUM(sommes) / SUM(effectifs)
+    totals = df.groupby(keys, observed=True, sort=False)[['value_sum', 'value_count']].sum().reset_index()
+    totals['value'] = (totals['value_sum'] / totals['value_count'].where(totals['value_count'] > 0)).astype(np.float32)
+    return totals.drop(columns=['value_sum', 'value_count'])
+
+
+def viewport_bounds(relayout_data):
+    # Coins visibles de la carte (relayoutData *._derived), élargis au degré entier pour que les petits
+    # déplacements réutilisent le cache ; None quand le monde entier est visible
+    derived = (relayout_data or {}).get('mapbox._derived') or (relayout_data or {}).get('map._derived')
+    if not derived or not derived.get('coordinates'):
+        return None
+    coordinates = np.asarray(derived['coordinates'], dtype=float)
+    west, east = np.floor(coordinates[:, 0].min()), np.ceil(coordinates[:, 0].max())
+    south, north = max(np.floor(coordinates[:, 1].min()), -90), min(np.ceil(coordinates[:, 1].max()), 90)
+    if east - west >= 360:
+        return None
+    west, east = (west + 180) % 360 - 180, (east + 180) % 360 - 180
+    return float(west), float(south), float(east), float(north)
+
+
+def viewport_zoom(relayout_data):
+    # Zoom courant de la carte (relayoutData *.zoom), zoom initial de la figure avant toute interaction
+    relayout_data = relayout_data or {}
+    zoom = relayout_data.get('mapbox.zoom', relayout_data.get('map.zoom'))
+    return float(zoom) if zoom is not None else DEFAULT_MAP_ZOOM
+
+
+def geohash_precision(zoom):
+    # Une tuile de 256 pixels couvre 360 / 2**zoom degrés de longitude : cellules de 32 à 64 pixels environ
+    return int(min(max((zoom + 3) * 2 // 5, 1), 8))
+
+
+def cell_bounds(bounds, precision):
+    # Fenêtre élargie aux bords des cellules : les cellules du bord sont complètes et les déplacements
+    # à l'intérieur d'une même cellule réutilisent le cache
+    if bounds is None:
+        return None
+    west, south, east, north = bounds
+    lat_size, lon_size = geohash_cell_size(precision)
+    return (float(np.floor((west + 180) / lon_size) * lon_size - 180),
+            float(max(np.floor((south + 90) / lat_size) * lat_size - 90, -90)),
+            float(np.ceil((east + 180) / lon_size) * lon_size - 180),
+            float(min(np.ceil((north + 90) / lat_size) * lat_size - 90, 90)))
+
+
+def visible_station_ids(stations, bounds):
+    if bounds is None:
+        return None
+    station_ids = stations.in_bbox(*bounds)
+    return None if len(station_ids) == len(stations) else station_ids
+
+
+def build_heatmap_query(parameter, year_range, month_range, station_ids=None):
     min_year, max_year = year_range
     min_month, max_month = month_range
-    query = f"""
-    SELECT s.latitude, s.longitude, s.station_city, s.station_country, s.station_code, 
-           ROUND(AVG(w.{parameter.lower()}), 2) as average_value
-    FROM WeatherFact w
-    JOIN StationDim s ON w.station_id = s.station_id
-    JOIN DateDim d ON w.date_id = d.date_id
-    WHERE d.year BETWEEN {min_year} AND {max_year}
-      AND d.month BETWEEN {min_month} AND {max_month}
-    GROUP BY s.station_code
+    # Agrégats mensuels pré-calculés, par station : les attributs viennent de l'index des stations
+    return f"""
+    SELECT a.station_id, SUM(a.{parameter.lower()}_sum) as value_sum, SUM(a.{parameter.lower()}_count) as value_count
+    FROM WeatherMonthlyAgg a
+    WHERE a.year BETWEEN {min_year} AND {max_year}
+      AND a.month BETWEEN {min_month} AND {max_month}
+      {id_filter('a.station_id', station_ids)}
+    GROUP BY a.station_id
     """
-    cursor.execute(query)
-    data = cursor.fetchall()
-    df = pd.DataFrame(data, columns=['latitude', 'longitude', 'station_city', 'station_country', 'station_code',
-                                     'average_value'])
+
+
+def fetch_heatmap_sums(parameter, year_range, month_range, station_ids):
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return run_snapshot('heatmap.snapshot', snapshot.aggregate, parameter.lower(), station_ids, year_range,
+                            month_range)
+    return run_query_frame(build_heatmap_query(parameter, year_range, month_range, station_ids), 'heatmap.query')
+
+
+@query_cache.cached
+def fetch_data_heatmap(parameter, year_range, month_range, bounds=None):
+    # bounds : (ouest, sud, est, nord) de la carte ; seules les stations visibles sont lues
+    stations = fetch_dimension_index().stations
+    data = fetch_heatmap_sums(parameter, year_range, month_range, visible_station_ids(stations, bounds))
+    with instrumentation.span('heatmap.dataframe', rows=len(data)):
+        df = stations.attributes(data['station_id'].to_numpy())
+        value_count = data['value_count'].where(data['value_count'] > 0)
+        df['average_value'] = (data['value_sum'] / value_count).round(2).astype(np.float32).to_numpy()
     return df
 
 
+@query_cache.cached
+def fetch_heatmap_cells(parameter, year_range, month_range, bounds=None, precision=2):
+    # Moyenne par cellule geohash (sommes et effectifs des stations de la cellule) : une ligne par cellule
+    # visible, quel que soit le nombre de stations
+    stations = fetch_dimension_index().stations
+    data = fetch_heatmap_sums(parameter, year_range, month_range, visible_station_ids(stations, bounds))
+    with instrumentation.span('heatmap.cells', rows=len(data)):
+        attributes = stations.attributes(data['station_id'].to_numpy())
+        cell, latitude, longitude = geohash_cells(attributes['latitude'].to_numpy(),
+                                                  attributes['longitude'].to_numpy(), precision)
+        df = pd.DataFrame({'cell': cell, 'latitude': latitude, 'longitude': longitude,
+                           'value_sum': data['value_sum'].to_numpy(), 'value_count': data['value_count'].to_numpy()})
+        df = df.groupby('cell', sort=False).agg(latitude=('latitude', 'first'), longitude=('longitude', 'first'),
+                                                stations=('cell', 'size'), value_sum=('value_sum', 'sum'),
+                                                value_count=('value_count', 'sum')).reset_index(drop=True)
+        value_count = df['value_count'].where(df['value_count'] > 0)
+        df['average_value'] = (df['value_sum'] / value_count).round(2).astype(np.float32)
+    return df[['latitude', 'longitude', 'stations', 'average_value']]
+
+
+def heatmap_cells_figure(df):
+    fig = px.scatter_mapbox(df, lat="latitude", lon="longitude", color="average_value",
+                            color_continuous_scale=px.colors.sequential.Bluered, size="stations",
+                            hover_data={"stations": True, "latitude": False, "longitude": False},
+                            zoom=DEFAULT_MAP_ZOOM, mapbox_style="carto-positron")
+    fig.update_coloraxes(colorbar_title="Weather Parameter Value")
+    return fig
+
+
 @app.callback(Output('heatmap', 'figure'), [Input('parameter-dropdown', 'value'), Input('year-range-slider', 'value'),
-                                            Input('month-range-slider', 'value')])
-def update_heatmap(parameter, year_range, month_range):
-    df = fetch_data_heatmap(parameter, year_range, month_range)
-    if not df.empty:
-        max_value = df['average_value'].max()
-        min_value = df['average_value'].min()
-        scaling_factor = 200 / (max_value - min_value)
-        df['marker_size'] = (df['average_value'] - min_value) * scaling_factor
-        fig = px.scatter_mapbox(df, lat="latitude", lon="longitude", color="average_value",
-                                color_continuous_scale=px.colors.sequential.Bluered,
-                                hover_data=["station_city", "station_country", "station_code"], zoom=3,
-                                mapbox_style="carto-positron", size="marker_size")
-        fig.update_coloraxes(colorbar_title="Weather Parameter Value")
-    else:
-        fig = px.scatter_mapbox()
+                                            Input('month-range-slider', 'value'), Input('heatmap', 'relayoutData'),
+                                            Input('heatmap-detail', 'value')])
+def update_heatmap(parameter, year_range, month_range, relayout_data, detail='auto'):
+    # detail : 'stations' (un marqueur par station), 'cells' (cellules geohash dont la taille suit le zoom)
+    # ou 'auto' (cellules dès que plus de HEATMAP_MAX_MARKERS stations sont visibles)
+    with instrumentation.span('heatmap.callback'):
+        with instrumentation.span('heatmap.fetch') as span:
+            bounds = viewport_bounds(relayout_data)
+            if detail == 'auto':
+                stations = fetch_dimension_index().stations
+                station_ids = visible_station_ids(stations, bounds)
+                detail = 'cells' if len(stations if station_ids is None else station_ids) > HEATMAP_MAX_MARKERS \
+                    else 'stations'
+            try:
+                if detail == 'cells':
+                    precision = geohash_precision(viewport_zoom(relayout_data))
+                    df = fetch('heatmap', fetch_heatmap_cells, parameter, year_range, month_range,
+                               cell_bounds(bounds, precision), precision)
+                else:
+                    df = fetch('heatmap', fetch_data_heatmap, parameter, year_range, month_range, bounds)
+            except FetchError as error:
+                return unavailable_figure(error)
+            span['rows'] = len(df)
+        with instrumentation.span('heatmap.figure', rows=len(df)):
+            if detail == 'cells' and not df.empty:
+                fig = heatmap_cells_figure(df)
+            elif not df.empty:
+                max_value = df['average_value'].max()
+                min_value = df['average_value'].min()
+                scaling_factor = 200 / ((max_value - min_value) or 1)
+                df['marker_size'] = (df['average_value'] - min_value) * scaling_factor
+                fig = px.scatter_mapbox(df, lat="latitude", lon="longitude", color="average_value",
+                                        color_continuous_scale=px.colors.sequential.Bluered,
+                                        hover_data=["station_city", "station_country", "station_code"],
+                                        zoom=DEFAULT_MAP_ZOOM, mapbox_style="carto-positron", size="marker_size")
+                fig.update_coloraxes(colorbar_title="Weather Parameter Value")
+            else:
+                fig = px.scatter_mapbox()
+            # Conserver le zoom et la position de l'utilisateur quand la figure est recalculée
+            fig.update_layout(uirevision='heatmap')
     return fig
 
 
-def fetch_data_barchart(year_range, month_range, parameter, country=None):
-    cursor = connect_to_data_warehouse().get_cursor()
+def build_barchart_query(year_range, month_range, parameter, station_ids=None):
     min_year, max_year = year_range
     min_month, max_month = month_range
-    country_filter = f"AND s.station_country = '{country}'" if country else ""
-    query = f"""
-    SELECT s.station_city, AVG(w.{parameter.lower()}) as average_value
-    FROM WeatherFact w
-    JOIN StationDim s ON w.station_id = s.station_id
-    JOIN DateDim d ON w.date_id = d.date_id
-    WHERE d.year BETWEEN {min_year} AND {max_year}
-      AND d.month BETWEEN {min_month} AND {max_month}
-      {country_filter}
-    GROUP BY s.station_city
+    return f"""
+    SELECT a.station_id, SUM(a.{parameter.lower()}_sum) as value_sum, SUM(a.{parameter.lower()}_count) as value_count
+    FROM WeatherMonthlyAgg a
+    WHERE a.year BETWEEN {min_year} AND {max_year}
+      AND a.month BETWEEN {min_month} AND {max_month}
+      {id_filter('a.station_id', station_ids)}
+    GROUP BY a.station_id
     """
-    cursor.execute(query)
-    data = cursor.fetchall()
-    df = pd.DataFrame(data, columns=['station_city', 'average_value'])
+
+
+@query_cache.cached
+def fetch_data_barchart(year_range, month_range, parameter, country=None):
+    stations = fetch_dimension_index().stations
+    station_ids = stations.in_country(country) if country else None
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        data = run_snapshot('barchart.snapshot', snapshot.aggregate, parameter.lower(), station_ids, year_range,
+                            month_range)
+    else:
+        data = run_query_frame(build_barchart_query(year_range, month_range, parameter, station_ids),
+                               'barchart.query')
+    with instrumentation.span('barchart.dataframe', rows=len(data)):
+        data['station_city'] = stations.attributes(data['station_id'].to_numpy())['station_city'].array
+        df = average_by(data, 'station_city').rename(columns={'value': 'average_value'})
     return df
 
 
@@ -100,263 +370,549 @@ def fetch_data_barchart(year_range, month_range, parameter, country=None):
               [Input('year-range-slider-bar', 'value'), Input('month-range-slider-bar', 'value'),
                Input('parameter-dropdown-bar', 'value'), Input('country-dropdown-bar', 'value')])
 def update_bar_chart(year_range, month_range, parameter, country):
-    df = fetch_data_barchart(year_range, month_range, parameter, country)
-    if not df.empty:
-        specific_colors = ['#F4F1DE', '#E07A5F', '#3D405B', '#81B29A', '#F2CC8F', '#e63946', '#f1faee', '#a8dadc',
-                           '#a8dadc', '#457b9d', '#fca311', '#e5989b', '#ffb4a2', '#ffcdb2', '#b5838d', '#b5e2fa',
-                           '#f7a072', '#faf0ca']
-        colors = [random.choice(specific_colors) for _ in range(len(df))]
-        fig = go.Figure(go.Bar(x=df['station_city'], y=df['average_value'], marker_color=colors))
-        fig.update_layout(title=f'Données moyennes par ville pour {parameter} en {year_range[0]}-{year_range[1]}',
-                          xaxis_title='Ville', yaxis_title='Valeur moyenne',
-                          yaxis=dict(range=[0, df['average_value'].max() * 1.5]))
+    with instrumentation.span('barchart.callback'):
+        with instrumentation.span('barchart.fetch') as span:
+            try:
+                df = fetch('barchart', fetch_data_barchart, year_range, month_range, parameter, country)
+            except FetchError as error:
+                return unavailable_figure(error)
+            span['rows'] = len(df)
+        with instrumentation.span('barchart.figure', rows=len(df)):
+            if not df.empty:
+                specific_colors = ['#F4F1DE', '#E07A5F', '#3D405B', '#81B29A', '#F2CC8F', '#e63946', '#f1faee',
+                                   '#a8dadc', '#a8dadc', '#457b9d', '#fca311', '#e5989b', '#ffb4a2', '#ffcdb2',
+                                   '#b5838d', '#b5e2fa', '#f7a072', '#faf0ca']
+                colors = [random.choice(specific_colors) for _ in range(len(df))]
+                fig = go.Figure(go.Bar(x=df['station_city'], y=df['average_value'], marker_color=colors))
+                fig.update_layout(
+                    title=f'Données moyennes par ville pour {parameter} en {year_range[0]}-{year_range[1]}',
+                    xaxis_title='Ville', yaxis_title='Valeur moyenne',
+                    yaxis=dict(range=[0, df['average_value'].max() * 1.5]))
+            else:
+                fig = go.Figure()
+    return fig
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets : conserve la forme de la courbe avec `threshold` points
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, threshold):
+    # Garde le minimum et le maximum de chaque tranche : les extrêmes restent visibles
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    bounds = np.linspace(0, n, threshold // 2 + 1).astype(np.int64)
+    selected = set()
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end > start:
+            selected.update((start + int(np.argmin(y[start:end])), start + int(np.argmax(y[start:end]))))
+    return np.array(sorted(selected), dtype=np.int64)
+
+
+def downsample_series(df, method, max_points):
+    parts = []
+    for _, city_df in df.groupby('station_city', sort=False, observed=True):
+        city_df = city_df.sort_values('period')
+        y = city_df['value'].to_numpy(dtype=np.float64)
+        if method == 'minmax':
+            indices = minmax_indices(y, max_points)
+        else:
+            x = city_df['period'].to_numpy(dtype='datetime64[D]').astype(np.float64)
+            indices = lttb_indices(x, y, max_points)
+        parts.append(city_df.iloc[indices])
+    return pd.concat(parts, ignore_index=True) if parts else df
+
+
+def build_line_query(station_ids=None, parameter='PRCP', grain='year', date_ranges=None):
+    # Seul le paramètre choisi est renvoyé, filtré sur des identifiants entiers (stations, intervalles de
+    # date_id) sans jointure : villes et dates sont rattachées depuis l'index des dimensions
+    column = parameter.lower()
+    if grain in ('year', 'month'):
+        period_columns = "a.year" if grain == 'year' else "a.year, a.month"
+        return f"""
+        SELECT a.station_id, {period_columns}, SUM(a.{column}_sum) as value_sum, SUM(a.{column}_count) as value_count
+        FROM WeatherMonthlyAgg a
+        WHERE 1 = 1 {id_filter('a.station_id', station_ids)}
+        GROUP BY a.station_id, {period_columns}
+        """
+    return f"""
+    SELECT w.station_id, w.date_id, w.{column} as value
+    FROM WeatherFact w
+    WHERE w.{column} IS NOT NULL
+      {id_filter('w.station_id', station_ids)}
+      {id_range_filter('w.date_id', date_ranges)}
+    """
+
+
+def build_last_year_query(parameter, station_ids=None):
+    # Dernière année où les stations ont une valeur du paramètre : lecture des agrégats mensuels, pas des faits
+    column = parameter.lower()
+    return f"""
+    SELECT MAX(a.year) as last_year
+    FROM WeatherMonthlyAgg a
+    WHERE a.{column}_count > 0 {id_filter('a.station_id', station_ids)}
+    """
+
+
+def line_day_years(last_year):
+    return (last_year - LINE_DAY_YEARS + 1, last_year)
+
+
+@query_cache.cached
+def fetch_line_day_years(country=None, parameter='PRCP'):
+    # Fenêtre de la granularité jour, calculée sur les stations choisies : un pays dont les relevés s'arrêtent
+    # plus tôt garde ses dernières années. None si aucune valeur
+    index = fetch_dimension_index()
+    station_ids = index.stations.in_country(country) if country else None
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        last_year = snapshot.last_year(parameter.lower(), station_ids)
     else:
-        fig = go.Figure()
+        last_year = run_query(build_last_year_query(parameter, station_ids), 'line.window')[0]['last_year']
+    return line_day_years(int(last_year)) if last_year is not None else None
+
+
+@query_cache.cached
+def fetch_line_data(country=None, parameter='PRCP', grain='year', downsample='lttb', max_points=500):
+    index = fetch_dimension_index()
+    station_ids = index.stations.in_country(country) if country else None
+    year_range = date_ranges = None
+    if grain == 'day':
+        year_range = fetch_line_day_years(country, parameter)
+        if year_range is None:
+            return pd.DataFrame(columns=['period', 'station_city', 'station_country', 'value'])
+        date_ranges = index.dates.id_ranges(year_range)
+    snapshot = current_snapshot()
+    if snapshot is not None and grain == 'day':
+        data = run_snapshot('line.snapshot', snapshot.series, parameter.lower(), station_ids, year_range)
+    elif snapshot is not None:
+        data = run_snapshot('line.snapshot', snapshot.aggregate, parameter.lower(), station_ids, None, None, grain)
+    else:
+        data = run_query_frame(build_line_query(station_ids, parameter, grain, date_ranges), 'line.query')
+    with instrumentation.span('line.dataframe', rows=len(data)):
+        if data.empty:
+            return pd.DataFrame(columns=['period', 'station_city', 'station_country', 'value'])
+        attributes = index.stations.attributes(data['station_id'].to_numpy())
+        data['station_city'] = attributes['station_city'].array
+        data['station_country'] = attributes['station_country'].array
+        if grain == 'day':
+            df = data.groupby(['station_city', 'station_country', 'date_id'], observed=True, sort=False)['value'] \
+                .mean().reset_index()
+            df = pd.concat([df, index.dates.attributes(df['date_id'].to_numpy())], axis=1)
+        else:
+            df = average_by(data, ['station_city', 'station_country', 'year'] + (['month'] if grain == 'month' else []))
+        df = df.dropna(subset=['value'])
+        # Villes absentes après filtrage : pas de catégorie vide (ni de trace vide dans la figure)
+        df['station_city'] = df['station_city'].cat.remove_unused_categories()
+        if grain == 'year':
+            df['period'] = df['year']
+        else:
+            df['period'] = pd.to_datetime(df[['year', 'month']].assign(day=df['day'] if grain == 'day' else 1))
+        df = df.sort_values('period', kind='stable', ignore_index=True)
+    if grain == 'day' and downsample:
+        # Granularité fine : sous-échantillonnage par ville pour borner la charge envoyée au navigateur
+        with instrumentation.span('line.downsample', rows=len(df)):
+            df = downsample_series(df, downsample, max_points)
+    return df[['period', 'station_city', 'station_country', 'value']]
+
+
+@app.callback(Output('weather-graph', 'figure'),
+              [Input('param-selector', 'value'), Input('country-dropdown-line', 'value'),
+               Input('grain-selector', 'value')])
+def update_graph(selected_param, country, grain):
+    with instrumentation.span('line.callback'):
+        with instrumentation.span('line.fetch') as span:
+            try:
+                df = fetch('line', fetch_line_data, country, selected_param, grain)
+            except FetchError as error:
+                return unavailable_figure(error)
+            span['rows'] = len(df)
+        with instrumentation.span('line.figure', rows=len(df)):
+            if not df.empty:
+                title = 'Weather Parameters Evolution Over Years'
+                if grain == 'day':
+                    first_year, last_year = fetch_line_day_years(country, selected_param)
+                    title = (f'Daily Weather Parameters, {first_year}-{last_year} '
+                             f'(last {LINE_DAY_YEARS} years with data)')
+                fig = px.line(df, x='period', y='value', color='station_city', title=title)
+                fig.update_layout(xaxis_title="Year", yaxis_title="Parameter Value", legend_title="City Stations",
+                                  font=dict(family="Arial, sans-serif", size=12, color="RebeccaPurple"))
+            else:
+                fig = go.Figure()
     return fig
 
 
-def fetch_line_data(country=None):
-    cursor = connect_to_data_warehouse().get_cursor()
-    country_filter = f"WHERE StationDim.station_country = '{country}'" if country else ""
-    query = f"""
-    SELECT YEAR, PRCP, TAVG, TMAX, TMIN, SNWD, PGTM, SNOW, WDFG, WSFG, StationDim.station_city, StationDim.station_country
-    FROM WeatherFact
-    JOIN DateDim ON WeatherFact.date_id = DateDim.date_id
-    JOIN StationDim ON WeatherFact.station_id = StationDim.station_id
-    {country_filter}
+def build_anomaly_query(parameter, year, month, station_ids=None):
+    # Un mois d'une année (agrégats mensuels, index (year, month, station_id)) face aux normales des moyennes
+    # mensuelles du même mois calendaire, lues par clé primaire : ni parcours des faits, ni réagrégation des années
+    column = parameter.lower()
+    return f"""
+    SELECT a.station_id, a.{column}_sum as value_sum, a.{column}_count as value_count,
+           c.last_year as baseline_last_year, c.{column}_n as baseline_count, c.{column}_mean as baseline_mean,
+           c.{column}_m2 as baseline_m2, c.{column}_min as baseline_min, c.{column}_max as baseline_max,
+           c.{column}_p10 as baseline_p10, c.{column}_p50 as baseline_p50, c.{column}_p90 as baseline_p90
+    FROM WeatherMonthlyAgg a
+    JOIN WeatherClimatology c ON c.station_id = a.station_id AND c.month = a.month
+    WHERE a.year = {int(year)} AND a.month = {int(month)} AND a.{column}_count > 0
+      {id_filter('a.station_id', station_ids)}
     """
-    cursor.execute(query)
-    data = cursor.fetchall()
-    df = pd.DataFrame(data)
+
+
+@query_cache.cached
+def fetch_anomaly_data(parameter, year, month, country=None):
+    stations = fetch_dimension_index().stations
+    station_ids = stations.in_country(country) if country else None
+    data = run_query_frame(build_anomaly_query(parameter, year, month, station_ids), 'anomaly.query')
+    with instrumentation.span('anomaly.dataframe', rows=len(data)):
+        df = stations.attributes(data['station_id'].to_numpy())
+        value = data['value_sum'].to_numpy() / data['value_count'].to_numpy()
+        count = data['baseline_count'].to_numpy()
+        baseline_mean = data['baseline_mean'].to_numpy()
+        baseline_m2 = data['baseline_m2'].to_numpy()
+        # L'année étudiée est comptée dans les normales (jusqu'à last_year) : on la retire de la référence
+        included = int(year) <= data['baseline_last_year'].to_numpy()
+        rest_count, rest_mean, rest_m2 = exclude_value(count, baseline_mean, baseline_m2, value)
+        count = np.where(included, rest_count, count)
+        baseline_mean = np.where(included, rest_mean, baseline_mean)
+        baseline_m2 = np.where(included, rest_m2, baseline_m2)
+        # Anomalie standardisée : écart à la moyenne des autres années en écarts-types des moyennes mensuelles
+        df['value'] = value.round(2).astype(np.float32)
+        df['baseline_mean'] = baseline_mean.round(2).astype(np.float32)
+        df['anomaly'] = (value - baseline_mean).round(2).astype(np.float32)
+        df['z_score'] = ((value - baseline_mean) / climatology_std(count, baseline_m2)).round(2).astype(np.float32)
+        df['baseline_years'] = count.astype(np.int64)
+        # Centiles, minimum et maximum stockés : toutes les années, y compris celle étudiée
+        for column in ('baseline_min', 'baseline_p10', 'baseline_p50', 'baseline_p90', 'baseline_max'):
+            df[column] = data[column].round(2).to_numpy(np.float32)
     return df
 
 
-@app.callback(Output('weather-graph', 'figure'),
-              [Input('param-selector', 'value'), Input('country-dropdown-line', 'value')])
-def update_graph(selected_param, country):
-    df = fetch_line_data(country)
-    if not df.empty:
-        fig = px.line(df, x='YEAR', y=selected_param, color='station_city',
-                      title='Weather Parameters Evolution Over Years')
-        fig.update_layout(xaxis_title="Year", yaxis_title="Parameter Value", legend_title="City Stations",
-                          font=dict(family="Arial, sans-serif", size=12, color="RebeccaPurple"))
-    else:
-        fig = go.Figure()
+@app.callback(Output('anomaly-map', 'figure'),
+              [Input('parameter-dropdown-anomaly', 'value'), Input('year-slider-anomaly', 'value'),
+               Input('month-slider-anomaly', 'value'), Input('country-dropdown-anomaly', 'value')])
+def update_anomaly_map(parameter, year, month, country):
+    with instrumentation.span('anomaly.callback'):
+        with instrumentation.span('anomaly.fetch') as span:
+            try:
+                df = fetch('anomaly', fetch_anomaly_data, parameter, year, month, country)
+            except FetchError as error:
+                return unavailable_figure(error)
+            span['rows'] = len(df)
+        with instrumentation.span('anomaly.figure', rows=len(df)):
+            if not df.empty:
+                limit = float(np.nanmax(np.abs(df['z_score']))) if df['z_score'].notna().any() else 1.0
+                fig = px.scatter_mapbox(df, lat="latitude", lon="longitude", color="z_score",
+                                        color_continuous_scale=px.colors.diverging.RdBu_r,
+                                        range_color=(-(limit or 1.0), limit or 1.0),
+                                        hover_data=["station_city", "station_country", "value", "baseline_mean",
+                                                    "anomaly", "baseline_p10", "baseline_p90",
+                                                    "baseline_years"],
+                                        zoom=DEFAULT_MAP_ZOOM, mapbox_style="carto-positron")
+                fig.update_traces(marker={'size': 10})
+                fig.update_coloraxes(colorbar_title="Anomalie (écarts-types)")
+            else:
+                fig = px.scatter_mapbox()
+            fig.update_layout(uirevision='anomaly-map')
     return fig
 
 
-line_chart_data = fetch_line_data()
-
-app.layout = html.Div([html.H1("Tableau de Bord d'Analyse Météorologique", className='header',
-                               style={'textAlign': 'center', 'marginBottom': '40px', 'color': '#333'}),
-                       dcc.Tabs(id="tabs", value='tab-1', children=[dcc.Tab(label='Carte de Chaleur', value='tab-1',
-                                                                            children=[html.Div([html.Label(
-                                                                                "Sélectionnez le paramètre météorologique:",
-                                                                                className='label',
-                                                                                style={'textAlign': 'center',
-                                                                                       'marginBottom': '20px',
-                                                                                       'marginTop': '10px'}),
-                                                                                dcc.Dropdown(id='parameter-dropdown',
-                                                                                             options=[{
-                                                                                                          'label': 'Analyse des précipitations (PRCP)',
-                                                                                                          'value': 'PRCP'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse des températures moyennes (TAVG)',
-                                                                                                          'value': 'TAVG'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse des températures maximales (TMAX)',
-                                                                                                          'value': 'TMAX'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse des températures minimales (TMIN)',
-                                                                                                          'value': 'TMIN'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse de l\'enneigement (SNWD)',
-                                                                                                          'value': 'SNWD'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse des heures de gel (PGTM)',
-                                                                                                          'value': 'PGTM'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse de la neige (SNOW)',
-                                                                                                          'value': 'SNOW'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse de la direction du vent (WDFG)',
-                                                                                                          'value': 'WDFG'},
-                                                                                                      {
-                                                                                                          'label': 'Analyse de la vitesse du vent (WSFG)',
-                                                                                                          'value': 'WSFG'}],
-                                                                                             value='PRCP',
-                                                                                             clearable=False,
-                                                                                             className='dropdown'),
-                                                                                html.Label(
-                                                                                    "Choisissez l'intervalle de temps:",
-                                                                                    className='label',
-                                                                                    style={'textAlign': 'center',
-                                                                                           'marginBottom': '20px',
-                                                                                           'marginTop': '10px'}),
-                                                                                dcc.RangeSlider(id='year-range-slider',
-                                                                                                min=int(
-                                                                                                    fetch_years()[0]),
-                                                                                                max=int(
-                                                                                                    fetch_years()[-1]),
-                                                                                                step=1, value=[
-                                                                                        int(fetch_years()[0]),
-                                                                                        int(fetch_years()[-1])], marks={
-                                                                                        int(year): str(year) for year in
-                                                                                        fetch_years()}, tooltip={
-                                                                                        'always_visible': True,
-                                                                                        'placement': 'bottom'},
-                                                                                                className='slider'),
-                                                                                html.Label(
-                                                                                    "Choisissez l'intervalle des mois:",
+@query_cache.cached
+def fetch_dimension_metadata():
+    # Métadonnées des dimensions lues avec des DISTINCT peu coûteux, partagées via le cache jusqu'au prochain chargement
+    years = run_query("SELECT DISTINCT year FROM DateDim ORDER BY year")
+    countries = run_query("SELECT DISTINCT station_country FROM StationDim "
+                          "WHERE station_country IS NOT NULL ORDER BY station_country")
+    return {'years': [row['year'] for row in years], 'countries': [row['station_country'] for row in countries]}
+
+
+def build_anomaly_tab(years, marked_years, countries):
+    # years : toutes les années chargées (le mois le plus récent est le plus demandé), marked_years : repères
+    label_style = {'marginBottom': '20px', 'marginTop': '10px'}
+    return dcc.Tab(label='Anomalies', value='tab-4', children=[html.Div([
+        html.Label("Sélectionnez le paramètre météorologique:", className='label', style=label_style),
+        dcc.Dropdown(id='parameter-dropdown-anomaly',
+                     options=[{'label': 'Précipitations (PRCP)', 'value': 'PRCP'},
+                              {'label': 'Température moyenne (TAVG)', 'value': 'TAVG'},
+                              {'label': 'Température maximale (TMAX)', 'value': 'TMAX'},
+                              {'label': 'Température minimale (TMIN)', 'value': 'TMIN'},
+                              {'label': 'Enneigement (SNWD)', 'value': 'SNWD'},
+                              {'label': 'Heures de gel (PGTM)', 'value': 'PGTM'},
+                              {'label': 'Neige (SNOW)', 'value': 'SNOW'},
+                              {'label': 'Direction du vent (WDFG)', 'value': 'WDFG'},
+                              {'label': 'Vitesse du vent (WSFG)', 'value': 'WSFG'}],
+                     value='TAVG', clearable=False, className='dropdown'),
+        html.Label("Choisissez l'année:", className='label', style=label_style),
+        dcc.Slider(id='year-slider-anomaly', min=int(years[0]), max=int(years[-1]), step=1, value=int(years[-1]),
+                   marks={int(year): str(year) for year in marked_years},
+                   tooltip={'always_visible': True, 'placement': 'bottom'}, className='slider'),
+        html.Label("Choisissez le mois:", className='label', style=label_style),
+        dcc.Slider(id='month-slider-anomaly', min=1, max=12, step=1, value=1,
+                   marks={month: str(month) for month in range(1, 13)},
+                   tooltip={'always_visible': True, 'placement': 'bottom'}, className='slider'),
+        html.Label("Sélectionnez un pays:", className='label', style=label_style),
+        dcc.Dropdown(id='country-dropdown-anomaly', options=[{'label': country, 'value': country}
+                                                             for country in countries],
+                     value=None, clearable=True, className='dropdown'),
+        dcc.Graph(id='anomaly-map', className='heatmap-graph')], className='content')])
+
+
+def build_layout(years, countries, all_years=None):
+    return html.Div([html.H1("Tableau de Bord d'Analyse Météorologique", className='header',
+                                   style={'textAlign': 'center', 'marginBottom': '40px', 'color': '#333'}),
+                           dcc.Tabs(id="tabs", value='tab-1', children=[dcc.Tab(label='Carte de Chaleur', value='tab-1',
+                                                                                children=[html.Div([html.Label(
+                                                                                    "Sélectionnez le paramètre météorologique:",
                                                                                     className='label',
                                                                                     style={'textAlign': 'center',
                                                                                            'marginBottom': '20px',
                                                                                            'marginTop': '10px'}),
-                                                                                dcc.RangeSlider(id='month-range-slider',
-                                                                                                min=1, max=12, step=1,
-                                                                                                value=[1, 12],
-                                                                                                marks={month: str(month)
-                                                                                                       for month in
-                                                                                                       list(range(1,
-                                                                                                                  13))},
-                                                                                                tooltip={
-                                                                                                    'always_visible': True,
-                                                                                                    'placement': 'bottom'},
-                                                                                                className='slider'),
-                                                                                dcc.Graph(id='heatmap',
-                                                                                          className='heatmap-graph')],
-                                                                                className='content')]),
-                                                                    dcc.Tab(label='Diagramme à Barres ', value='tab-2',
-                                                                            children=[html.Div([html.Label(
-                                                                                "Sélectionnez le paramètre météorologique:",
-                                                                                className='label',
-                                                                                style={'marginBottom': '20px',
-                                                                                       'marginTop': '10px'}),
-                                                                                dcc.Dropdown(
-                                                                                    id='parameter-dropdown-bar',
-                                                                                    options=[{
-                                                                                        'label': 'Analyse des précipitations (PRCP)',
-                                                                                        'value': 'PRCP'}, {
-                                                                                        'label': 'Analyse des températures moyennes (TAVG)',
-                                                                                        'value': 'TAVG'}, {
-                                                                                        'label': 'Analyse des températures maximales (TMAX)',
-                                                                                        'value': 'TMAX'}, {
-                                                                                        'label': 'Analyse des températures minimales (TMIN)',
-                                                                                        'value': 'TMIN'}, {
-                                                                                        'label': 'Analyse de l\'enneigement (SNWD)',
-                                                                                        'value': 'SNWD'}, {
-                                                                                        'label': 'Analyse des heures de gel (PGTM)',
-                                                                                        'value': 'PGTM'}, {
-                                                                                        'label': 'Analyse de la neige (SNOW)',
-                                                                                        'value': 'SNOW'}, {
-                                                                                        'label': 'Analyse de la direction du vent (WDFG)',
-                                                                                        'value': 'WDFG'}, {
-                                                                                        'label': 'Analyse de la vitesse du vent (WSFG)',
-                                                                                        'value': 'WSFG'}], value='TAVG',
-                                                                                    clearable=False,
-                                                                                    style={'width': '50%',
-                                                                                           'margin': 'auto',
-                                                                                           'marginBottom': '20px'},
-                                                                                    className='dropdown'),
-                                                                                html.Label("Sélectionnez un pays:",
-                                                                                           className='label', style={
-                                                                                        'marginBottom': '20px',
-                                                                                        'marginTop': '10px'}),
-                                                                                dcc.Dropdown(id='country-dropdown-bar',
-                                                                                             options=[{'label': country,
-                                                                                                       'value': country}
-                                                                                                      for country in
-                                                                                                      sorted(
-                                                                                                          line_chart_data[
-                                                                                                              'station_country'].unique())],
-                                                                                             value=None, clearable=True,
-                                                                                             style={'width': '50%',
-                                                                                                    'margin': 'auto',
-                                                                                                    'marginBottom': '20px'},
-                                                                                             className='dropdown'),
-                                                                                html.Label(
-                                                                                    "Choisissez l'intervalle de temps:",
+                                                                                    dcc.Dropdown(id='parameter-dropdown',
+                                                                                                 options=[{
+                                                                                                              'label': 'Analyse des précipitations (PRCP)',
+                                                                                                              'value': 'PRCP'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse des températures moyennes (TAVG)',
+                                                                                                              'value': 'TAVG'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse des températures maximales (TMAX)',
+                                                                                                              'value': 'TMAX'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse des températures minimales (TMIN)',
+                                                                                                              'value': 'TMIN'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse de l\'enneigement (SNWD)',
+                                                                                                              'value': 'SNWD'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse des heures de gel (PGTM)',
+                                                                                                              'value': 'PGTM'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse de la neige (SNOW)',
+                                                                                                              'value': 'SNOW'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse de la direction du vent (WDFG)',
+                                                                                                              'value': 'WDFG'},
+                                                                                                          {
+                                                                                                              'label': 'Analyse de la vitesse du vent (WSFG)',
+                                                                                                              'value': 'WSFG'}],
+                                                                                                 value='PRCP',
+                                                                                                 clearable=False,
+                                                                                                 className='dropdown'),
+                                                                                    html.Label(
+                                                                                        "Choisissez l'intervalle de temps:",
+                                                                                        className='label',
+                                                                                        style={'textAlign': 'center',
+                                                                                               'marginBottom': '20px',
+                                                                                               'marginTop': '10px'}),
+                                                                                    dcc.RangeSlider(id='year-range-slider',
+                                                                                                    min=int(years[0]),
+                                                                                                    max=int(years[-1]),
+                                                                                                    step=1, value=[
+                                                                                            int(years[0]),
+                                                                                            int(years[-1])], marks={
+                                                                                            int(year): str(year) for year in years}, tooltip={
+                                                                                            'always_visible': True,
+                                                                                            'placement': 'bottom'},
+                                                                                                    className='slider'),
+                                                                                    html.Label(
+                                                                                        "Choisissez l'intervalle des mois:",
+                                                                                        className='label',
+                                                                                        style={'textAlign': 'center',
+                                                                                               'marginBottom': '20px',
+                                                                                               'marginTop': '10px'}),
+                                                                                    dcc.RangeSlider(id='month-range-slider',
+                                                                                                    min=1, max=12, step=1,
+                                                                                                    value=[1, 12],
+                                                                                                    marks={month: str(month)
+                                                                                                           for month in
+                                                                                                           list(range(1,
+                                                                                                                      13))},
+                                                                                                    tooltip={
+                                                                                                        'always_visible': True,
+                                                                                                        'placement': 'bottom'},
+                                                                                                    className='slider'),
+                                                                                    dcc.RadioItems(id='heatmap-detail',
+                                                                                                   options=[{
+                                                                                                       'label': 'Automatique',
+                                                                                                       'value': 'auto'}, {
+                                                                                                       'label': 'Par station',
+                                                                                                       'value': 'stations'}, {
+                                                                                                       'label': 'Par cellule (selon le zoom)',
+                                                                                                       'value': 'cells'}],
+                                                                                                   value='auto',
+                                                                                                   inline=True,
+                                                                                                   style={'textAlign': 'center',
+                                                                                                          'marginBottom': '20px'}),
+                                                                                    dcc.Graph(id='heatmap',
+                                                                                              className='heatmap-graph')],
+                                                                                    className='content')]),
+                                                                        dcc.Tab(label='Diagramme à Barres ', value='tab-2',
+                                                                                children=[html.Div([html.Label(
+                                                                                    "Sélectionnez le paramètre météorologique:",
                                                                                     className='label',
                                                                                     style={'marginBottom': '20px',
                                                                                            'marginTop': '10px'}),
-                                                                                dcc.RangeSlider(
-                                                                                    id='year-range-slider-bar',
-                                                                                    min=int(fetch_years()[0]),
-                                                                                    max=int(fetch_years()[-1]), step=1,
-                                                                                    value=[int(fetch_years()[0]),
-                                                                                           int(fetch_years()[-1])],
-                                                                                    marks={int(year): str(year) for year
-                                                                                           in fetch_years()},
-                                                                                    tooltip={'always_visible': True,
-                                                                                             'placement': 'bottom'},
-                                                                                    className='slider'), html.Label(
-                                                                                    "Choisissez l'intervalle des mois:",
+                                                                                    dcc.Dropdown(
+                                                                                        id='parameter-dropdown-bar',
+                                                                                        options=[{
+                                                                                            'label': 'Analyse des précipitations (PRCP)',
+                                                                                            'value': 'PRCP'}, {
+                                                                                            'label': 'Analyse des températures moyennes (TAVG)',
+                                                                                            'value': 'TAVG'}, {
+                                                                                            'label': 'Analyse des températures maximales (TMAX)',
+                                                                                            'value': 'TMAX'}, {
+                                                                                            'label': 'Analyse des températures minimales (TMIN)',
+                                                                                            'value': 'TMIN'}, {
+                                                                                            'label': 'Analyse de l\'enneigement (SNWD)',
+                                                                                            'value': 'SNWD'}, {
+                                                                                            'label': 'Analyse des heures de gel (PGTM)',
+                                                                                            'value': 'PGTM'}, {
+                                                                                            'label': 'Analyse de la neige (SNOW)',
+                                                                                            'value': 'SNOW'}, {
+                                                                                            'label': 'Analyse de la direction du vent (WDFG)',
+                                                                                            'value': 'WDFG'}, {
+                                                                                            'label': 'Analyse de la vitesse du vent (WSFG)',
+                                                                                            'value': 'WSFG'}], value='TAVG',
+                                                                                        clearable=False,
+                                                                                        style={'width': '50%',
+                                                                                               'margin': 'auto',
+                                                                                               'marginBottom': '20px'},
+                                                                                        className='dropdown'),
+                                                                                    html.Label("Sélectionnez un pays:",
+                                                                                               className='label', style={
+                                                                                            'marginBottom': '20px',
+                                                                                            'marginTop': '10px'}),
+                                                                                    dcc.Dropdown(id='country-dropdown-bar',
+                                                                                                 options=[{'label': country,
+                                                                                                           'value': country}
+                                                                                                          for country in
+                                                                                                          countries],
+                                                                                                 value=None, clearable=True,
+                                                                                                 style={'width': '50%',
+                                                                                                        'margin': 'auto',
+                                                                                                        'marginBottom': '20px'},
+                                                                                                 className='dropdown'),
+                                                                                    html.Label(
+                                                                                        "Choisissez l'intervalle de temps:",
+                                                                                        className='label',
+                                                                                        style={'marginBottom': '20px',
+                                                                                               'marginTop': '10px'}),
+                                                                                    dcc.RangeSlider(
+                                                                                        id='year-range-slider-bar',
+                                                                                        min=int(years[0]),
+                                                                                        max=int(years[-1]), step=1,
+                                                                                        value=[int(years[0]),
+                                                                                               int(years[-1])],
+                                                                                        marks={int(year): str(year) for year
+                                                                                               in years},
+                                                                                        tooltip={'always_visible': True,
+                                                                                                 'placement': 'bottom'},
+                                                                                        className='slider'), html.Label(
+                                                                                        "Choisissez l'intervalle des mois:",
+                                                                                        className='label',
+                                                                                        style={'marginBottom': '20px',
+                                                                                               'marginTop': '10px'}),
+                                                                                    dcc.RangeSlider(
+                                                                                        id='month-range-slider-bar', min=1,
+                                                                                        max=12, step=1, value=[1, 12],
+                                                                                        marks={month: str(month) for month
+                                                                                               in list(range(1, 13))},
+                                                                                        tooltip={'always_visible': True,
+                                                                                                 'placement': 'bottom'},
+                                                                                        className='slider'),
+                                                                                    dcc.Graph(id='bar-chart',
+                                                                                              className='bar-chart')],
+                                                                                    className='content')]),
+                                                                        dcc.Tab(label='Graphique Temporel', value='tab-3',
+                                                                                children=[html.Div([html.Label(
+                                                                                    "Sélectionnez le paramètre météorologique:",
                                                                                     className='label',
                                                                                     style={'marginBottom': '20px',
                                                                                            'marginTop': '10px'}),
-                                                                                dcc.RangeSlider(
-                                                                                    id='month-range-slider-bar', min=1,
-                                                                                    max=12, step=1, value=[1, 12],
-                                                                                    marks={month: str(month) for month
-                                                                                           in list(range(1, 13))},
-                                                                                    tooltip={'always_visible': True,
-                                                                                             'placement': 'bottom'},
-                                                                                    className='slider'),
-                                                                                dcc.Graph(id='bar-chart',
-                                                                                          className='bar-chart')],
-                                                                                className='content')]),
-                                                                    dcc.Tab(label='Graphique Temporel', value='tab-3',
-                                                                            children=[html.Div([html.Label(
-                                                                                "Sélectionnez le paramètre météorologique:",
-                                                                                className='label',
-                                                                                style={'marginBottom': '20px',
-                                                                                       'marginTop': '10px'}),
-                                                                                dcc.Dropdown(id='param-selector',
-                                                                                             options=[{
-                                                                                                 'label': 'Precipitation (PRCP)',
-                                                                                                 'value': 'PRCP'}, {
-                                                                                                 'label': 'Average Temperature (TAVG)',
-                                                                                                 'value': 'TAVG'}, {
-                                                                                                 'label': 'Maximum Temperature (TMAX)',
-                                                                                                 'value': 'TMAX'}, {
-                                                                                                 'label': 'Minimum Temperature (TMIN)',
-                                                                                                 'value': 'TMIN'}, {
-                                                                                                 'label': 'Snow Depth (SNWD)',
-                                                                                                 'value': 'SNWD'}, {
-                                                                                                 'label': 'Peak Gust Time (PGTM)',
-                                                                                                 'value': 'PGTM'}, {
-                                                                                                 'label': 'Snowfall (SNOW)',
-                                                                                                 'value': 'SNOW'}, {
-                                                                                                 'label': 'Direction of Fastest 2-Min Wind (WDFG)',
-                                                                                                 'value': 'WDFG'}, {
-                                                                                                 'label': 'Speed of Fastest 2-Min Wind (WSFG)',
-                                                                                                 'value': 'WSFG'}, ],
-                                                                                             value='PRCP',
-                                                                                             clearable=False,
-                                                                                             style={'width': '80%',
-                                                                                                    'margin': 'auto'},
-                                                                                             className='dropdown'),
-                                                                                html.Label("Sélectionnez un pays:",
-                                                                                           className='label', style={
-                                                                                        'marginBottom': '20px',
-                                                                                        'marginTop': '10px'}),
-                                                                                dcc.Dropdown(id='country-dropdown-line',
-                                                                                             options=[{'label': country,
-                                                                                                       'value': country}
-                                                                                                      for country in
-                                                                                                      sorted(
-                                                                                                          line_chart_data[
-                                                                                                              'station_country'].unique())],
-                                                                                             value=None, clearable=True,
-                                                                                             style={'width': '80%',
-                                                                                                    'margin': 'auto',
-                                                                                                    'marginBottom': '20px',
-                                                                                                    'marginTop': '10px'},
-                                                                                             className='dropdown'),
-                                                                                dcc.Graph(id='weather-graph',
-                                                                                          className='line-chart')],
-                                                                                className='content')])])],
-                      style={'backgroundColor': '#f1f1f1', 'padding': '20px'})
+                                                                                    dcc.Dropdown(id='param-selector',
+                                                                                                 options=[{
+                                                                                                     'label': 'Precipitation (PRCP)',
+                                                                                                     'value': 'PRCP'}, {
+                                                                                                     'label': 'Average Temperature (TAVG)',
+                                                                                                     'value': 'TAVG'}, {
+                                                                                                     'label': 'Maximum Temperature (TMAX)',
+                                                                                                     'value': 'TMAX'}, {
+                                                                                                     'label': 'Minimum Temperature (TMIN)',
+                                                                                                     'value': 'TMIN'}, {
+                                                                                                     'label': 'Snow Depth (SNWD)',
+                                                                                                     'value': 'SNWD'}, {
+                                                                                                     'label': 'Peak Gust Time (PGTM)',
+                                                                                                     'value': 'PGTM'}, {
+                                                                                                     'label': 'Snowfall (SNOW)',
+                                                                                                     'value': 'SNOW'}, {
+                                                                                                     'label': 'Direction of Fastest 2-Min Wind (WDFG)',
+                                                                                                     'value': 'WDFG'}, {
+                                                                                                     'label': 'Speed of Fastest 2-Min Wind (WSFG)',
+                                                                                                     'value': 'WSFG'}, ],
+                                                                                                 value='PRCP',
+                                                                                                 clearable=False,
+                                                                                                 style={'width': '80%',
+                                                                                                        'margin': 'auto'},
+                                                                                                 className='dropdown'),
+                                                                                    html.Label("Sélectionnez un pays:",
+                                                                                               className='label', style={
+                                                                                            'marginBottom': '20px',
+                                                                                            'marginTop': '10px'}),
+                                                                                    dcc.Dropdown(id='country-dropdown-line',
+                                                                                                 options=[{'label': country,
+                                                                                                           'value': country}
+                                                                                                          for country in
+                                                                                                          countries],
+                                                                                                 value=None, clearable=True,
+                                                                                                 style={'width': '80%',
+                                                                                                        'margin': 'auto',
+                                                                                                        'marginBottom': '20px',
+                                                                                                        'marginTop': '10px'},
+                                                                                                 className='dropdown'),
+                                                                                    dcc.RadioItems(id='grain-selector',
+                                                                                                   options=[{
+                                                                                                       'label': 'Par année',
+                                                                                                       'value': 'year'}, {
+                                                                                                       'label': 'Par mois',
+                                                                                                       'value': 'month'}, {
+                                                                                                       'label': f'Par jour ({LINE_DAY_YEARS} dernières années, sous-échantillonné)',
+                                                                                                       'value': 'day'}],
+                                                                                                   value='year',
+                                                                                                   inline=True,
+                                                                                                   style={'textAlign': 'center',
+                                                                                                          'marginBottom': '20px'}),
+                                                                                    dcc.Graph(id='weather-graph',
+                                                                                              className='line-chart')],
+                                                                                    className='content')]),
+                                                                        build_anomaly_tab(all_years or years, years,
+                                                                                          countries)])],
+                          style={'backgroundColor': '#f1f1f1', 'padding': '20px'})
+
+
+def serve_layout():
+    # Layout construit à la première requête et non à l'import : le démarrage ne touche pas l'entrepôt
+    metadata = fetch_dimension_metadata()
+    return build_layout(fetch_years(), metadata['countries'], metadata['years'])
+
+
+# Mêmes composants avec des métadonnées factices : Dash valide les callbacks sans interroger l'entrepôt
+app.validation_layout = build_layout([0], [])
+app.layout = serve_layout
 
 if __name__ == '__main__':
     app.run_server(debug=True)
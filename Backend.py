@@ -0,0 +1,112 @@
+import os
+import threading
+from contextlib import nullcontext
+
+from Dimensions import DimensionIndex
+from Model import typed_result_frame
+from Scheduler import current_task
+
+# Tables du schéma en étoile exportées par DataWarehouseManager.export_parquet ; les faits et les agrégats
+# sont partitionnés par année (répertoires year=YYYY)
+PARQUET_TABLES = {
+    'DateDim': 'DateDim.parquet',
+    'StationDim': 'StationDim.parquet',
+    'WeatherFact': os.path.join('WeatherFact', '*', '*.parquet'),
+    'WeatherMonthlyAgg': os.path.join('WeatherMonthlyAgg', '*', '*.parquet'),
+    'WeatherClimatology': 'WeatherClimatology.parquet',
+}
+LOAD_VERSION_FILE = 'load_version.txt'
+
+
+class MySQLBackend:
+    # Requêtes exécutées sur le serveur MySQL via le pool de connexions de DataWarehouseManager
+    name = 'mysql'
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+
+    def query(self, query):
+        with self.warehouse.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query)
+                return cursor.fetchall()
+
+    def query_frame(self, query):
+        # Grands résultats : tuples lus en flux et colonnes NumPy typées (voir DataWarehouseManager.fetch_columns)
+        task = current_task()
+        return self.warehouse.fetch_columns(query, cancel_scope=task.cancellable if task else None)
+
+    def dimension_index(self):
+        return self.warehouse.dimension_index()
+
+    def load_version(self):
+        return self.warehouse.get_load_version()
+
+
+class DuckDBBackend:
+    # Moteur colonnaire embarqué lisant l'export Parquet : aucun serveur, mêmes requêtes SQL que MySQL
+    name = 'duckdb'
+
+    def __init__(self, parquet_dir):
+        import duckdb
+
+        self.parquet_dir = parquet_dir
+        self._database = duckdb.connect()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._views_version = None
+        self._refresh_views()
+
+    def _refresh_views(self):
+        # Recréer les vues quand un nouvel export a remplacé les fichiers. Le lien de l'export est résolu une fois :
+        # les vues lisent toutes la version dont elles portent le numéro
+        with self._lock:
+            export_dir = os.path.realpath(self.parquet_dir)
+            version = self.load_version(export_dir)
+            if version == self._views_version:
+                return
+            for table, pattern in PARQUET_TABLES.items():
+                path = os.path.join(export_dir, pattern).replace("'", "''")
+                self._database.execute(f"CREATE OR REPLACE VIEW {table} AS "
+                                       f"SELECT * FROM read_parquet('{path}', hive_partitioning = true)")
+            self._views_version = version
+
+    def _cursor(self):
+        # Un curseur DuckDB par thread : ils partagent la même base en mémoire
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._database.cursor()
+        return cursor
+
+    def query(self, query):
+        self._refresh_views()
+        cursor = self._cursor()
+        cursor.execute(query)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def query_frame(self, query):
+        self._refresh_views()
+        cursor = self._cursor()
+        task = current_task()
+        with task.cancellable(cursor.interrupt) if task else nullcontext():
+            return typed_result_frame(cursor.execute(query).df())
+
+    def dimension_index(self):
+        return DimensionIndex.from_query(self.query_frame)
+
+    def load_version(self, export_dir=None):
+        try:
+            with open(os.path.join(export_dir or self.parquet_dir, LOAD_VERSION_FILE)) as version_file:
+                return int(version_file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+
+def create_backend(warehouse, backend=None, parquet_dir=None):
+    backend = backend or os.environ.get('WAREHOUSE_BACKEND', 'mysql')
+    if backend == 'duckdb':
+        return DuckDBBackend(parquet_dir or os.environ.get('WAREHOUSE_PARQUET_DIR', 'parquet_warehouse'))
+    if backend == 'mysql':
+        return MySQLBackend(warehouse)
+    raise ValueError(f"Backend inconnu : {backend!r} (attendu : 'mysql' ou 'duckdb')")
@@ -0,0 +1,177 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def normalize_value(value):
+    # Même requête, même clé : listes/tuples, types NumPy et flottants entiers sont ramenés à une forme unique
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize_value(item) for item in value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class DiskCacheBackend:
+    # Stockage SQLite partagé par tous les workers d'une même machine
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    version INTEGER,
+                    expires_at REAL,
+                    value BLOB
+                )
+                """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, cache_key, version):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM query_cache WHERE cache_key = ? AND version = ? AND expires_at > ?",
+                               (cache_key, version, time.time())).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, cache_key, version, value, ttl):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?)",
+                         (cache_key, version, time.time() + ttl, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+
+    def purge(self, current_version=None):
+        with self._connect() as conn:
+            if current_version is None:
+                conn.execute("DELETE FROM query_cache")
+            else:
+                conn.execute("DELETE FROM query_cache WHERE version != ? OR expires_at <= ?",
+                             (current_version, time.time()))
+
+
+class QueryCache:
+    # LRU en mémoire borné (entrées + TTL), avec un second niveau optionnel sur disque partagé entre workers.
+    # Les entrées sont rattachées à la version de chargement de l'entrepôt : un nouveau chargement les invalide.
+    def __init__(self, max_entries=256, ttl=300, disk_path=None, version_source=None, version_check_interval=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = DiskCacheBackend(disk_path) if disk_path else None
+        self.version_source = version_source
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self._counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0,
+                          'expirations': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def current_version(self):
+        if self.version_source is None:
+            return 0
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at >= self.version_check_interval:
+            version = self.version_source()
+            if self._version is not None and version != self._version:
+                self._version = version
+                self.invalidate()
+            self._version = version
+            self._version_checked_at = now
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters['invalidations'] += 1
+        # Forcer la relecture de la version au prochain accès
+        self._version_checked_at = 0.0
+        if self.disk is not None:
+            self.disk.purge(self._version if self.version_source is not None else None)
+
+    def get(self, cache_key):
+        version = self.current_version()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(cache_key)
+                    self._counters['hits'] += 1
+                    self._counters['memory_hits'] += 1
+                    return True, value
+                del self._entries[cache_key]
+                self._counters['expirations'] += 1
+        if self.disk is not None:
+            value = self.disk.get(cache_key, version)
+            if value is not None:
+                self._count('hits')
+                self._count('disk_hits')
+                self._store(cache_key, version, value)
+                return True, value
+        self._count('misses')
+        return False, None
+
+    def set(self, cache_key, value):
+        version = self.current_version()
+        self._store(cache_key, version, value)
+        if self.disk is not None:
+            self.disk.set(cache_key, version, value, self.ttl)
+
+    def _store(self, cache_key, version, value):
+        with self._lock:
+            self._entries[cache_key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def cached(self, func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            normalized = (func.__qualname__,) + tuple(
+                (name, normalize_value(value)) for name, value in bound.arguments.items())
+            cache_key = hashlib.sha1(repr(normalized).encode('utf-8')).hexdigest()
+            found, value = self.get(cache_key)
+            if not found:
+                value = func(*args, **kwargs)
+                self.set(cache_key, value)
+            # Les callbacks modifient parfois le DataFrame renvoyé : ne jamais exposer l'objet en cache
+            return value.copy() if hasattr(value, 'copy') else value
+
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl,
+                         version=self._version, disk=self.disk is not None)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
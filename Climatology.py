@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# Normales climatologiques par station et mois calendaire : distribution interannuelle des moyennes mensuelles
+# (une valeur par année, sum / count de WeatherMonthlyAgg), comparable à la moyenne d'un mois donné. Pour chaque
+# paramètre : effectif (années), moyenne, M2 (somme des carrés des écarts à la moyenne, d'où l'écart-type), minimum,
+# maximum et centiles. Effectif, moyenne et M2 se fusionnent exactement (Chan et al.) : une année ajoutée met à jour
+# les normales sans relire l'historique. last_year (dernière année incluse) distingue un ajout d'une révision.
+CLIMATOLOGY_PERCENTILES = (10, 25, 50, 75, 90)
+CLIMATOLOGY_STATS = ['n', 'mean', 'm2', 'min', 'max'] + [f'p{percentile}' for percentile in CLIMATOLOGY_PERCENTILES]
+CLIMATOLOGY_KEYS = ['station_id', 'month']
+
+
+def climatology_columns(measure_columns):
+    return [f'{column}_{stat}' for column in measure_columns for stat in CLIMATOLOGY_STATS]
+
+
+def climatology_stats(facts, measure_columns):
+    # facts : station_id, month et une colonne par paramètre (NaN = valeur absente) ; un seul groupby vectorisé
+    grouped = facts.groupby(CLIMATOLOGY_KEYS, sort=True)[list(measure_columns)]
+    count = grouped.count()
+    stats = {'n': count, 'mean': grouped.mean(), 'm2': grouped.var(ddof=0) * count, 'min': grouped.min(),
+             'max': grouped.max()}
+    quantiles = grouped.quantile([percentile / 100 for percentile in CLIMATOLOGY_PERCENTILES])
+    for percentile in CLIMATOLOGY_PERCENTILES:
+        stats[f'p{percentile}'] = quantiles.xs(percentile / 100, level=-1)
+    result = pd.concat({stat: frame for stat, frame in stats.items()}, axis=1)
+    result.columns = [f'{column}_{stat}' for stat, column in result.columns]
+    return result[climatology_columns(measure_columns)].reset_index()
+
+
+def monthly_mean_stats(monthly, measure_columns):
+    # monthly : lignes de WeatherMonthlyAgg (station_id, year, month, {paramètre}_sum, {paramètre}_count)
+    means = pd.DataFrame({key: monthly[key].to_numpy(np.int64) for key in CLIMATOLOGY_KEYS})
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in measure_columns:
+            count = monthly[f'{column}_count'].to_numpy(np.float64)
+            means[column] = np.where(count > 0, monthly[f'{column}_sum'].to_numpy(np.float64) / count, np.nan)
+    stats = climatology_stats(means, measure_columns)
+    last_year = monthly.groupby(CLIMATOLOGY_KEYS, sort=True)['year'].max().to_numpy(np.int64)
+    stats.insert(len(CLIMATOLOGY_KEYS), 'last_year', last_year)
+    return stats
+
+
+def merge_climatology(left, right, measure_columns):
+    # Fusion de normales calculées sur des années disjointes. Effectif, moyenne, M2, min et max sont exacts ;
+    # les centiles sont la moyenne des centiles pondérée par les effectifs (approximation, exacte à la reconstruction)
+    both = left.merge(right, on=CLIMATOLOGY_KEYS, how='outer', suffixes=('_a', '_b'))
+    result = {key: both[key].to_numpy() for key in CLIMATOLOGY_KEYS}
+    result['last_year'] = np.fmax(both['last_year_a'].to_numpy(np.float64),
+                                  both['last_year_b'].to_numpy(np.float64)).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in measure_columns:
+            n_a = both[f'{column}_n_a'].fillna(0).to_numpy(np.float64)
+            n_b = both[f'{column}_n_b'].fillna(0).to_numpy(np.float64)
+            n = n_a + n_b
+            mean_a = both[f'{column}_mean_a'].fillna(0).to_numpy(np.float64)
+            delta = both[f'{column}_mean_b'].fillna(0).to_numpy(np.float64) - mean_a
+            result[f'{column}_n'] = n
+            result[f'{column}_mean'] = np.where(n > 0, mean_a + delta * n_b / n, np.nan)
+            result[f'{column}_m2'] = np.where(n > 0, both[f'{column}_m2_a'].fillna(0).to_numpy(np.float64)
+                                              + both[f'{column}_m2_b'].fillna(0).to_numpy(np.float64)
+                                              + delta ** 2 * n_a * n_b / n, np.nan)
+            result[f'{column}_min'] = np.fmin(both[f'{column}_min_a'].to_numpy(np.float64),
+                                              both[f'{column}_min_b'].to_numpy(np.float64))
+            result[f'{column}_max'] = np.fmax(both[f'{column}_max_a'].to_numpy(np.float64),
+                                              both[f'{column}_max_b'].to_numpy(np.float64))
+            for percentile in CLIMATOLOGY_PERCENTILES:
+                value_a = both[f'{column}_p{percentile}_a'].fillna(0).to_numpy(np.float64)
+                value_b = both[f'{column}_p{percentile}_b'].fillna(0).to_numpy(np.float64)
+                result[f'{column}_p{percentile}'] = np.where(n > 0, (value_a * n_a + value_b * n_b) / n, np.nan)
+    result = pd.DataFrame(result)
+    return result[CLIMATOLOGY_KEYS + ['last_year'] + climatology_columns(measure_columns)] \
+        .sort_values(CLIMATOLOGY_KEYS, ignore_index=True)
+
+
+def complete_station_frames(frames):
+    # Morceaux triés par station -> morceaux ne coupant aucune station (centiles exacts par station et mois)
+    carry = None
+    for frame in frames:
+        if carry is not None:
+            frame = pd.concat([carry, frame], ignore_index=True)
+        if frame.empty:
+            continue
+        station_ids = frame['station_id'].to_numpy()
+        split = int(np.searchsorted(station_ids, station_ids[-1], side='left'))
+        if split:
+            yield frame.iloc[:split]
+        carry = frame.iloc[split:]
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def climatology_std(count, m2):
+    # Écart-type (non biaisé) à partir de l'effectif et de M2
+    count = np.asarray(count, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 1, np.sqrt(np.asarray(m2, dtype=np.float64) / (count - 1)), np.nan)
+
+
+def exclude_value(count, mean, m2, value):
+    # Retirer une valeur incluse dans (effectif, moyenne, M2) : référence sans l'année étudiée
+    count = np.asarray(count, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    value = np.asarray(value, dtype=np.float64)
+    rest = count - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rest_mean = np.where(rest > 0, (count * mean - value) / rest, np.nan)
+        rest_m2 = np.where(rest > 0, np.maximum(np.asarray(m2, dtype=np.float64)
+                                                - (value - mean) * (value - rest_mean), 0.0), np.nan)
+    return rest, rest_mean, rest_m2
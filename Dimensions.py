@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+STATION_INDEX_QUERY = ("SELECT station_id, station_code, station_city, station_country, latitude, longitude "
+                       "FROM StationDim")
+DATE_INDEX_QUERY = "SELECT date_id, year, month, day FROM DateDim"
+
+
+def _positions(ids):
+    # Table directe identifiant -> position (les identifiants AUTO_INCREMENT sont denses)
+    positions = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int64)
+    positions[ids] = np.arange(len(ids))
+    return positions
+
+
+def _take(positions, ids):
+    ids = np.asarray(ids, dtype=np.int64)
+    found = (ids >= 0) & (ids < len(positions))
+    result = np.full(len(ids), -1, dtype=np.int64)
+    result[found] = positions[ids[found]]
+    if (result < 0).any():
+        raise KeyError(f"Identifiants inconnus : {np.unique(ids[result < 0])[:10].tolist()}")
+    return result
+
+
+def id_runs(ids):
+    # Identifiants triés -> intervalles contigus [(premier, dernier), ...]
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if not len(ids):
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1)
+    starts = np.concatenate(([ids[0]], ids[breaks + 1]))
+    ends = np.concatenate((ids[breaks], [ids[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def geohash_cell_size(precision):
+    # Taille (degrés de latitude, degrés de longitude) d'une cellule geohash de `precision` caractères :
+    # 5 bits par caractère, alternés en commençant par la longitude
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_cells(latitude, longitude, precision):
+    # Cellule geohash de chaque point sous forme d'entier (indice de ligne x colonnes + indice de colonne),
+    # sans encodage texte, et centre de la cellule
+    lat_size, lon_size = geohash_cell_size(precision)
+    rows, columns = round(180 / lat_size), round(360 / lon_size)
+    row = np.clip(np.floor((np.asarray(latitude, dtype=np.float64) + 90) / lat_size), 0, rows - 1).astype(np.int64)
+    column = np.clip(np.floor((np.asarray(longitude, dtype=np.float64) + 180) / lon_size), 0,
+                     columns - 1).astype(np.int64)
+    return row * columns + column, -90 + (row + 0.5) * lat_size, -180 + (column + 0.5) * lon_size
+
+
+class StationIndex:
+    # StationDim en tableaux triés par (latitude, longitude) : filtre de fenêtre cartographique par recherche
+    # dichotomique sur la latitude puis masque vectorisé sur la longitude
+    def __init__(self, df):
+        df = df.sort_values(['latitude', 'longitude'], kind='stable', ignore_index=True)
+        self.station_id = df['station_id'].to_numpy(np.int64)
+        self.latitude = df['latitude'].to_numpy(np.float64)
+        self.longitude = df['longitude'].to_numpy(np.float64)
+        self.station_code = df['station_code'].to_numpy(object)
+        self.station_city = pd.Categorical(df['station_city'])
+        self.station_country = pd.Categorical(df['station_country'])
+        self._positions = _positions(self.station_id)
+
+    def __len__(self):
+        return len(self.station_id)
+
+    def in_bbox(self, west, south, east, north):
+        start = np.searchsorted(self.latitude, south, side='left')
+        stop = np.searchsorted(self.latitude, north, side='right')
+        longitude = self.longitude[start:stop]
+        if west <= east:
+            mask = (longitude >= west) & (longitude <= east)
+        else:
+            # Fenêtre à cheval sur l'antiméridien
+            mask = (longitude >= west) | (longitude <= east)
+        return np.sort(self.station_id[start:stop][mask])
+
+    def in_country(self, country):
+        if country not in self.station_country.categories:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(self.station_id[self.station_country == country])
+
+    def attributes(self, station_ids):
+        # Attributs des stations alignés sur station_ids (remplace la jointure sur StationDim)
+        positions = _take(self._positions, station_ids)
+        return pd.DataFrame({'latitude': self.latitude[positions], 'longitude': self.longitude[positions],
+                             'station_city': self.station_city.take(positions),
+                             'station_country': self.station_country.take(positions),
+                             'station_code': self.station_code[positions]})
+
+
+class DateIndex:
+    # DateDim en tableaux triés par (année, mois, jour) : une plage (années, mois) devient une liste
+    # d'intervalles contigus de date_id, utilisables sur l'index (date_id, station_id) des faits
+    def __init__(self, df):
+        df = df.sort_values(['year', 'month', 'day'], kind='stable', ignore_index=True)
+        self.date_id = df['date_id'].to_numpy(np.int64)
+        self.year = df['year'].to_numpy(np.int16)
+        self.month = df['month'].to_numpy(np.int8)
+        self.day = df['day'].to_numpy(np.int8)
+        self._positions = _positions(self.date_id)
+
+    def __len__(self):
+        return len(self.date_id)
+
+    def mask(self, year_range=None, month_range=None):
+        mask = np.ones(len(self.date_id), dtype=bool)
+        if year_range is not None:
+            mask &= (self.year >= year_range[0]) & (self.year <= year_range[1])
+        if month_range is not None:
+            mask &= (self.month >= month_range[0]) & (self.month <= month_range[1])
+        return mask
+
+    def ids(self, year_range=None, month_range=None):
+        return self.date_id[self.mask(year_range, month_range)]
+
+    def dense(self, values, fill):
+        # Valeurs alignées sur self.date_id -> tableau indexé directement par date_id
+        values = np.asarray(values)
+        result = np.full(len(self._positions), fill, dtype=values.dtype)
+        result[self.date_id] = values
+        return result
+
+    def id_ranges(self, year_range=None, month_range=None):
+        return id_runs(self.ids(year_range, month_range))
+
+    def months_id_ranges(self, months):
+        # (année, mois) quelconques -> intervalles de date_id
+        months = pd.MultiIndex.from_tuples(list(months), names=['year', 'month'])
+        mask = pd.MultiIndex.from_arrays([self.year, self.month]).isin(months)
+        return id_runs(self.date_id[mask])
+
+    def attributes(self, date_ids):
+        positions = _take(self._positions, date_ids)
+        return pd.DataFrame({'year': self.year[positions], 'month': self.month[positions],
+                             'day': self.day[positions]})
+
+
+class DimensionIndex:
+    def __init__(self, stations, dates):
+        self.stations = stations
+        self.dates = dates
+
+    @classmethod
+    def from_query(cls, query_frame):
+        # query_frame(sql) -> DataFrame : DataWarehouseManager.fetch_columns ou un backend (query_frame)
+        return cls(StationIndex(query_frame(STATION_INDEX_QUERY)), DateIndex(query_frame(DATE_INDEX_QUERY)))
@@ -0,0 +1,168 @@
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Bornes (secondes) des histogrammes de durée exportés au format Prometheus
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+slow_query_logger = logging.getLogger('weather.slow_queries')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instrumentation:
+    # Spans chronométrés (requêtes SQL, DataFrames, figures, phases de chargement) agrégés par nom en histogrammes
+    # et compteurs de lignes/octets. Les métriques sont propres au processus : chaque worker gunicorn expose les siennes.
+    def __init__(self, slow_query_ms=500, slow_query_log_size=200):
+        self.slow_query_ms = slow_query_ms
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        # Le dictionnaire renvoyé peut être complété dans le bloc : rows, nbytes, sql
+        start_time = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as error:
+            attributes['error'] = type(error).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start_time, **attributes)
+
+    def record(self, name, duration, rows=None, nbytes=None, sql=None, error=None):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'errors': 0, 'rows': 0, 'bytes': 0,
+                                             'buckets': [0] * len(DURATION_BUCKETS)}
+            stats['count'] += 1
+            stats['sum'] += duration
+            stats['max'] = max(stats['max'], duration)
+            stats['errors'] += error is not None
+            stats['rows'] += int(rows or 0)
+            stats['bytes'] += int(nbytes or 0)
+            bucket = bisect_left(DURATION_BUCKETS, duration)
+            if bucket < len(DURATION_BUCKETS):
+                stats['buckets'][bucket] += 1
+        request_spans = getattr(self._local, 'request_spans', None)
+        if request_spans is not None:
+            request_spans.append((name, duration))
+        if sql is not None and duration * 1000 >= self.slow_query_ms:
+            entry = {'timestamp': time.time(), 'span': name, 'ms': round(duration * 1000, 1), 'rows': rows,
+                     'error': error, 'sql': ' '.join(sql.split())}
+            self.slow_queries.append(entry)
+            slow_query_logger.warning("Requête lente (%s, %.0f ms, %s lignes) : %s", name, entry['ms'], rows,
+                                      entry['sql'])
+
+    def start_request(self):
+        # Spans du thread courant conservés jusqu'à la fin de la requête HTTP (en-tête Server-Timing)
+        self._local.request_spans = []
+
+    def finish_request(self):
+        request_spans = getattr(self._local, 'request_spans', None) or []
+        self._local.request_spans = None
+        return request_spans
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats, buckets=list(stats['buckets'])) for name, stats in self._spans.items()}
+
+    def render_prometheus(self, gauges=None):
+        spans = self.snapshot()
+        lines = ["# HELP dashboard_span_seconds Durée des étapes instrumentées.",
+                 "# TYPE dashboard_span_seconds histogram"]
+        for name, stats in sorted(spans.items()):
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                cumulative += count
+                lines.append(f'dashboard_span_seconds_bucket{{span="{_label(name)}",le="{bound}"}} {cumulative}')
+            lines.append(f'dashboard_span_seconds_bucket{{span="{_label(name)}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'dashboard_span_seconds_sum{{span="{_label(name)}"}} {stats["sum"]:.6f}')
+            lines.append(f'dashboard_span_seconds_count{{span="{_label(name)}"}} {stats["count"]}')
+        for metric, key, description in (('dashboard_span_rows_total', 'rows', "Lignes traitées par étape."),
+                                         ('dashboard_span_bytes_total', 'bytes', "Octets produits par étape."),
+                                         ('dashboard_span_errors_total', 'errors', "Étapes terminées en erreur.")):
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{span="{_label(name)}"}} {stats[key]}' for name, stats in sorted(spans.items())]
+        for metric, value in sorted((gauges or {}).items()):
+            lines += [f"# TYPE {metric} gauge", f"{metric} {float(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+def _server_timing_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def instrument_server(server, instrumentation, profile_dir=None):
+    # Durée et taille de chaque réponse HTTP, en-tête Server-Timing, et profilage cProfile à la demande :
+    # actif seulement si profile_dir est défini, puis par requête (en-tête X-Profile: 1 ou cookie posé par /profiling)
+    from flask import g, make_response, request
+
+    @server.before_request
+    def start_request_span():
+        instrumentation.start_request()
+        g.request_start = time.perf_counter()
+        g.profiler = None
+        if profile_dir and (request.headers.get('X-Profile') == '1' or request.cookies.get('profile') == '1'):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Un autre profileur est déjà actif dans ce processus
+                return
+            g.profiler = profiler
+
+    @server.after_request
+    def finish_request_span(response):
+        duration = time.perf_counter() - g.get('request_start', time.perf_counter())
+        payload_bytes = response.calculate_content_length()
+        body = request.get_json(silent=True) if request.path.endswith('_dash-update-component') else None
+        target = body.get('output', request.path) if isinstance(body, dict) else request.path
+        instrumentation.record(f"http {target}", duration, nbytes=payload_bytes)
+        request_spans = instrumentation.finish_request()
+        callback_spans = [(name, span_duration) for name, span_duration in request_spans
+                          if name.endswith('.callback')]
+        if callback_spans:
+            # Ce qui reste après le callback : sérialisation JSON de la figure et envoi par Dash
+            prefix = callback_spans[0][0][:-len('.callback')]
+            serialize_duration = max(duration - sum(span_duration for _, span_duration in callback_spans), 0.0)
+            instrumentation.record(f"{prefix}.serialize", serialize_duration, nbytes=payload_bytes)
+            request_spans.append((f"{prefix}.serialize", serialize_duration))
+        request_spans.append(('total', duration))
+        response.headers['Server-Timing'] = ", ".join(f"{_server_timing_name(name)};dur={span_duration * 1000:.1f}"
+                                                      for name, span_duration in request_spans)
+        profiler = g.get('profiler')
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns()}-"
+                                             f"{_server_timing_name(target).strip('_.')}.prof")
+            profiler.dump_stats(path)
+            response.headers['X-Profile-File'] = path
+        return response
+
+    if profile_dir:
+        @server.route('/profiling')
+        def toggle_profiling():
+            # /profiling?enabled=1 profile toutes les requêtes suivantes du navigateur, /profiling?enabled=0 arrête
+            enabled = request.args.get('enabled', '1') == '1'
+            response = make_response(f"Profilage {'activé' if enabled else 'désactivé'} ; fichiers dans {profile_dir}\n")
+            if enabled:
+                response.set_cookie('profile', '1')
+            else:
+                response.delete_cookie('profile')
+            return response
+
+
+instrumentation = Instrumentation(slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 500)))
@@ -1,62 +1,353 @@
+import functools
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
 import pandas as pd
 import pymysql
+from pandas.api.types import union_categoricals
+
+from Climatology import CLIMATOLOGY_KEYS, climatology_columns, complete_station_frames, merge_climatology, \
+    monthly_mean_stats
+from Dimensions import DATE_INDEX_QUERY, STATION_INDEX_QUERY, DateIndex, DimensionIndex
+from Instrumentation import instrumentation
+from Snapshot import publish_directory, staging_directory, write_fact_snapshot
+from Verification import (PARTITION_KEYS, checksum_columns, compare_checksums, source_checksums,
+                          warehouse_checksum_query)
+
+DATE_COLUMNS = ['DAY', 'MONTH', 'YEAR']
+STATION_COLUMNS = ['STATIONCODE', 'STATIONCITY', 'STATIONCOUNTRY', 'LATITUDE', 'LONGITUDE', 'ELEVATION']
+MEASURE_COLUMNS = ['PRCP', 'TAVG', 'TMAX', 'TMIN', 'SNWD', 'PGTM', 'SNOW', 'WDFG', 'WSFG']
+FACT_COLUMNS = ['date_id', 'station_id'] + MEASURE_COLUMNS
+FACT_MEASURES_DDL = ",\n                ".join(f"{column.lower()} FLOAT" for column in MEASURE_COLUMNS)
+# Agrégats mensuels (somme et effectif non nul par paramètre) : AVG = SUM(sum) / SUM(count) reste exact
+ROLLUP_COLUMNS = [f"{column.lower()}_{suffix}" for column in MEASURE_COLUMNS for suffix in ('sum', 'count')]
+ROLLUP_COLUMNS_DDL = ",\n                ".join(
+    f"{column.lower()}_sum DOUBLE,\n                {column.lower()}_count INT" for column in MEASURE_COLUMNS)
+# Normales des moyennes mensuelles par station et mois calendaire (voir Climatology.py) : moyenne et M2 en DOUBLE,
+# fusionnés à chaque chargement
+CLIMATOLOGY_COLUMNS = climatology_columns([column.lower() for column in MEASURE_COLUMNS])
+CLIMATOLOGY_TABLE_COLUMNS = CLIMATOLOGY_KEYS + ['last_year'] + CLIMATOLOGY_COLUMNS
+CLIMATOLOGY_COLUMNS_DDL = ",\n                ".join(
+    f"{column} {'INT' if column.endswith('_n') else 'DOUBLE' if column.endswith(('_mean', '_m2')) else 'FLOAT'}"
+    for column in CLIMATOLOGY_COLUMNS)
+PARQUET_FACT_COLUMNS = ['weather_id', 'date_id', 'station_id', 'year'] + [column.lower() for column in MEASURE_COLUMNS]
+# Types explicites pour la lecture par morceaux (évite l'inférence et réduit la mémoire)
+CSV_DTYPES = {'DAY': 'int8', 'MONTH': 'int8', 'YEAR': 'int16', 'STATIONCODE': 'str', 'STATIONCITY': 'str',
+              'STATIONCOUNTRY': 'str', 'LATITUDE': 'float64', 'LONGITUDE': 'float64', 'ELEVATION': 'float64',
+              **{column: 'float32' for column in MEASURE_COLUMNS}}
+# Typage des résultats de requêtes matérialisés en colonnes : mesures en float32, texte répétitif en catégories
+FLOAT32_RESULT_COLUMNS = frozenset(['value', 'average_value', 'baseline_min', 'baseline_max', 'baseline_p10',
+                                    'baseline_p50', 'baseline_p90'] + [column.lower() for column in MEASURE_COLUMNS])
+CATEGORY_RESULT_COLUMNS = frozenset(['station_city', 'station_country'])
+# Sommes et effectifs d'agrégats (SUM renvoie des DECIMAL côté MySQL) gardés en float64
+FLOAT64_RESULT_COLUMNS = frozenset(['value_sum', 'value_count', 'baseline_last_year', 'baseline_count',
+                                    'baseline_mean', 'baseline_m2'])
+
+
+class ConnectionPool:
+    # Pool borné et thread-safe ; une instance par processus (un worker gunicorn = un pool)
+    def __init__(self, connect, max_size=4, timeout=30, health_check_interval=5):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval  # Secondes d'inactivité avant un ping
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def _checkout(self):
+        start_time = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError(f"Aucune connexion disponible après {self.timeout}s (pool de {self.max_size})")
+        waited = time.perf_counter() - start_time
+        try:
+            conn = self._healthy_idle_connection()
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self._open += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._checkouts += 1
+            self._wait_seconds_total += waited
+            self._wait_seconds_max = max(self._wait_seconds_max, waited)
+        return conn
+
+    def _healthy_idle_connection(self):
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - last_used < self.health_check_interval:
+                return conn
+            try:
+                conn.ping(reconnect=False)
+                return conn
+            except pymysql.Error:
+                with self._lock:
+                    self._open -= 1
+                    self._health_check_failures += 1
+                self._close_quietly(conn)
+
+    def _checkin(self, conn):
+        broken = False
+        try:
+            # Terminer la transaction pour ne pas garder un instantané périmé entre deux requêtes
+            conn.rollback()
+        except pymysql.Error:
+            broken = True
+        if broken:
+            self._close_quietly(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        with self._lock:
+            self._in_use -= 1
+            if broken:
+                self._open -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except pymysql.Error:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close_quietly(conn)
+            with self._lock:
+                self._open -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {'pool_size': self.max_size, 'open': self._open, 'in_use': self._in_use,
+                    'idle': self._idle.qsize(), 'utilization': self._in_use / self.max_size,
+                    'peak_utilization': self._peak_in_use / self.max_size,
+                    'checkouts': self._checkouts, 'timeouts': self._timeouts,
+                    'health_check_failures': self._health_check_failures,
+                    'wait_seconds_total': self._wait_seconds_total, 'wait_seconds_max': self._wait_seconds_max,
+                    'wait_seconds_avg': self._wait_seconds_total / self._checkouts if self._checkouts else 0.0}
 
 
 class DataWarehouseManager:
-    def __init__(self, host, username, password, database, charset, cursorclass):
+    def __init__(self, host, username, password, database, charset, cursorclass, local_infile=False,
+                 pool_size=None, pool_timeout=30, partition_years=None, covering_measures=MEASURE_COLUMNS):
         self.host = host
         self.username = username
         self.password = password
         self.database = database
         self.charset = charset
         self.cursorclass = cursorclass
+        self.local_infile = local_infile  # Nécessaire pour LOAD DATA LOCAL INFILE
+        self.partition_years = partition_years  # (première, dernière) : partitionne WeatherFact par année
+        # Paramètres proposés par le tableau de bord : un index couvrant par paramètre sur les faits et le rollup
+        self.covering_measures = [column.lower() for column in covering_measures]
+        # Taille du pool par processus : avec gunicorn, workers x pool_size doit rester sous max_connections
+        self.pool_size = pool_size or int(os.environ.get('WAREHOUSE_POOL_SIZE', 4))
+        self.pool_timeout = pool_timeout
+        self._pool = None
+        self._pool_pid = None
+        self.phase_timings = {}  # Durées (s) par phase du dernier load_data_warehouse
+        self.verification_report = None  # Partitions en écart de la dernière vérification (verify_load)
+        self.load_listeners = []  # Fonctions appelées à la fin de chaque chargement (ex. invalidation de cache)
+        self.conn = None
+        self.cursor = None
         self.date_id_map = {}  # Carte pour stocker les identifiants de date
         self.station_id_map = {}  # Carte pour stocker les identifiants de station
+        # Versions tabulaires des cartes, utilisées pour les jointures vectorisées du chargement en masse
+        self.date_dim_df = pd.DataFrame(columns=['date_id'] + DATE_COLUMNS)
+        self.station_dim_df = pd.DataFrame(columns=['station_id', 'STATIONCODE'])
+
+    def _new_connection(self):
+        return pymysql.connect(host=self.host, user=self.username, password=self.password, database=self.database,
+                               charset=self.charset, cursorclass=self.cursorclass, local_infile=self.local_infile)
 
     def connect(self):
-        self.conn = pymysql.connect(host=self.host, user=self.username, password=self.password, database=self.database,
-                                    charset=self.charset, cursorclass=self.cursorclass)
+        self.conn = self._new_connection()
         self.cursor = self.conn.cursor()
 
+    def get_pool(self):
+        # Pool créé paresseusement et recréé après un fork (les connexions ne se partagent pas entre processus)
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ConnectionPool(self._new_connection, self.pool_size, self.pool_timeout)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        with self.get_pool().connection() as conn:
+            yield conn
+
+    def pool_metrics(self):
+        return self.get_pool().metrics()
+
+    def dimension_index(self):
+        # Copies en mémoire de StationDim et DateDim sous forme de tableaux triés (voir Dimensions.py)
+        return DimensionIndex.from_query(self.fetch_columns)
+
+    def date_index(self):
+        # Index des dates déjà connues du chargement en cours, sans relire DateDim
+        return DateIndex(self.date_dim_df.rename(columns=str.lower))
+
+    def kill_query(self, connection_id):
+        # Interrompre la requête en cours d'une autre connexion (hors pool : il peut être épuisé)
+        conn = self._new_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("KILL QUERY %s", (connection_id,))
+        finally:
+            conn.close()
+
+    def fetch_columns(self, query, params=None, chunksize=50000, cancel_scope=None):
+        # Résultat lu en flux sous forme de tuples (curseur non bufferisé) et converti morceau par morceau en
+        # tableaux NumPy typés : ni dictionnaire par ligne, ni inférence de types par pandas.
+        # cancel_scope(interrupt) : contexte pendant lequel la requête peut être interrompue (voir Scheduler)
+        with self.connection() as conn:
+            scope = (cancel_scope(functools.partial(self.kill_query, conn.thread_id())) if cancel_scope
+                     else nullcontext())
+            with scope, conn.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute(query, params)
+                columns = [description[0] for description in cursor.description]
+                parts = [[] for _ in columns]
+                while True:
+                    rows = cursor.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    for column, part, values in zip(columns, parts, zip(*rows)):
+                        part.append(result_array(column, values))
+                    del rows
+        return pd.DataFrame({column: concat_result_arrays(column, part) for column, part in zip(columns, parts)})
+
+    def add_load_listener(self, listener):
+        self.load_listeners.append(listener)
+
+    def get_load_version(self):
+        # Identifiant du dernier chargement terminé : change à chaque load_data_warehouse, quel que soit le processus
+        with self.connection() as conn:
+            with conn.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute("SELECT COALESCE(MAX(load_id), 0) FROM LoadHistory")
+                return cursor.fetchone()[0]
+
+    def record_load(self):
+        self.cursor.execute("INSERT INTO LoadHistory () VALUES ()")
+        self.conn.commit()
+        for listener in self.load_listeners:
+            listener()
+
     def disconnect(self):
         if self.cursor:
             self.cursor.close()
         if self.conn:
             self.conn.close()
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.close()
 
-    def create_tables(self):
+    def create_tables(self, defer_indexes=False):
+        # En mode partitionné, WeatherFact porte l'année (clé de partition) et ne peut pas avoir de clés étrangères
+        if self.partition_years:
+            first_year, last_year = self.partition_years
+            partitions = ",\n                ".join(
+                [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in range(first_year, last_year + 1)]
+                + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+            fact_table_query = f"""
+            CREATE TABLE IF NOT EXISTS WeatherFact (
+                weather_id INT AUTO_INCREMENT,
+                date_id INT,
+                station_id INT,
+                year INT NOT NULL,
+                {FACT_MEASURES_DDL},
+                PRIMARY KEY (weather_id, year)
+            )
+            PARTITION BY RANGE (year) (
+                {partitions}
+            )
+            """
+        else:
+            fact_table_query = f"""
+            CREATE TABLE IF NOT EXISTS WeatherFact (
+                weather_id INT AUTO_INCREMENT PRIMARY KEY,
+                date_id INT,
+                station_id INT,
+                {FACT_MEASURES_DDL},
+                FOREIGN KEY (date_id) REFERENCES DateDim(date_id),
+                FOREIGN KEY (station_id) REFERENCES StationDim(station_id)
+            )
+            """
         create_tables_queries = ["""
-            CREATE TABLE DateDim (
+            CREATE TABLE IF NOT EXISTS DateDim (
                 date_id INT AUTO_INCREMENT PRIMARY KEY,
                 day INT,
                 month INT,
-                year INT
+                year INT,
+                UNIQUE KEY uq_date_natural (year, month, day)
             )
             """, """
-            CREATE TABLE StationDim (
+            CREATE TABLE IF NOT EXISTS StationDim (
                 station_id INT AUTO_INCREMENT PRIMARY KEY,
                 station_code VARCHAR(255),
                 station_city VARCHAR(255),
                 station_country VARCHAR(255),
                 latitude FLOAT,
                 longitude FLOAT,
-                elevation FLOAT
+                elevation FLOAT,
+                UNIQUE KEY uq_station_code (station_code)
             )
-            """, """
-            CREATE TABLE WeatherFact (
-                weather_id INT AUTO_INCREMENT PRIMARY KEY,
-                date_id INT,
+            """, fact_table_query, """
+            CREATE TABLE IF NOT EXISTS LoadHistory (
+                load_id INT AUTO_INCREMENT PRIMARY KEY,
+                finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """, f"""
+            CREATE TABLE IF NOT EXISTS WeatherMonthlyAgg (
                 station_id INT,
-                prcp FLOAT,
-                tavg FLOAT,
-                tmax FLOAT,
-                tmin FLOAT,
-                snwd FLOAT,
-                pgtm FLOAT,
-                snow FLOAT,
-                wdfg FLOAT,
-                wsfg FLOAT,
-                FOREIGN KEY (date_id) REFERENCES DateDim(date_id),
+                year INT,
+                month INT,
+                {ROLLUP_COLUMNS_DDL},
+                PRIMARY KEY (station_id, year, month),
+                FOREIGN KEY (station_id) REFERENCES StationDim(station_id)
+            )
+            """, f"""
+            CREATE TABLE IF NOT EXISTS WeatherClimatology (
+                station_id INT,
+                month INT,
+                last_year INT NOT NULL,
+                {CLIMATOLOGY_COLUMNS_DDL},
+                PRIMARY KEY (station_id, month),
                 FOREIGN KEY (station_id) REFERENCES StationDim(station_id)
             )
             """]
@@ -64,6 +355,47 @@ class DataWarehouseManager:
             self.cursor.execute(query)
 
         self.conn.commit()
+        if not defer_indexes:
+            self.create_indexes()
+
+    def _secondary_indexes(self):
+        # Index couvrants calqués sur les WHERE / GROUP BY du tableau de bord : chaque requête ne lit qu'un
+        # paramètre, son index porte ses colonnes et la ligne n'est jamais relue par la clé primaire. Le rollup est
+        # filtré par période (heatmap, barres), les faits par station et intervalles de date_id (courbe par jour).
+        # Les requêtes par station du rollup (courbes par année et mois) parcourent sa clé primaire, déjà couvrante
+        fact_unique_columns = "date_id, station_id, year" if self.partition_years else "date_id, station_id"
+        covering_indexes = [index for column in self.covering_measures for index in (
+            ('WeatherFact', f'ix_fact_station_date_{column}',
+             f"INDEX ix_fact_station_date_{column} (station_id, date_id, {column})"),
+            ('WeatherMonthlyAgg', f'ix_agg_period_{column}',
+             f"INDEX ix_agg_period_{column} (year, month, station_id, {column}_sum, {column}_count)"))]
+        return [
+            # Clés naturelles : déjà dans CREATE TABLE, ajoutées ici aux entrepôts créés avant elles (sans quoi
+            # les upserts incrémentaux des dimensions inséreraient des doublons)
+            ('DateDim', 'uq_date_natural', "UNIQUE KEY uq_date_natural (year, month, day)"),
+            ('StationDim', 'uq_station_code', "UNIQUE KEY uq_station_code (station_code)"),
+            ('StationDim', 'ix_station_country_city', "INDEX ix_station_country_city (station_country, station_city)"),
+            ('WeatherFact', 'uq_fact_date_station',
+             f"UNIQUE KEY uq_fact_date_station ({fact_unique_columns})"),
+            # Parcours trié des faits par station (instantané, normales)
+            ('WeatherFact', 'ix_fact_station_date', "INDEX ix_fact_station_date (station_id, date_id)"),
+        ] + covering_indexes
+
+    def create_indexes(self):
+        # Idempotent : MySQL n'a pas de ADD INDEX IF NOT EXISTS, on consulte information_schema
+        existing = set(map(tuple, self._select_frame("""
+            SELECT DISTINCT table_name, index_name FROM information_schema.statistics WHERE table_schema = %s
+            """, ['table_name', 'index_name'], (self.database,)).values.tolist()))
+        for table, index_name, definition in self._secondary_indexes():
+            if (table, index_name) not in existing:
+                start_time = time.perf_counter()
+                self.cursor.execute(f"ALTER TABLE {table} ADD {definition}")
+                print(f"Index {index_name} créé sur {table} en {time.perf_counter() - start_time:.1f}s.")
+        self.conn.commit()
+
+    def explain_query(self, query, params=None):
+        # Plan d'exécution simplifié : table, index retenu et type d'accès (ALL = parcours complet)
+        return self._select_frame(f"EXPLAIN {query}", params=params)[['table', 'type', 'key', 'rows', 'Extra']]
 
     def get_cursor(self):
         return self.cursor
@@ -82,7 +414,7 @@ class DataWarehouseManager:
     def insert_station_dim(self, df):
         station_dim_insert_query = "INSERT INTO StationDim (station_code, station_city, station_country, latitude, longitude, elevation) VALUES (%s, %s, %s, %s, %s, %s)"
         station_dim_data = df[['STATIONCODE', 'STATIONCITY', 'STATIONCOUNTRY', 'LATITUDE', 'LONGITUDE',
-                               'ELEVATION']].drop_duplicates().values.tolist()
+                               'ELEVATION']].drop_duplicates(subset='STATIONCODE', keep='last').values.tolist()
         for data in station_dim_data:
             self.cursor.execute(station_dim_insert_query, data)
             self.conn.commit()
@@ -92,10 +424,7 @@ class DataWarehouseManager:
             self.station_id_map[data[0]] = station_id
 
     def insert_fact_weather(self, df):
-        weather_fact_insert_query = """
-        INSERT INTO WeatherFact (date_id, station_id, prcp, tavg, tmax, tmin, snwd, pgtm, snow, wdfg, wsfg)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        weather_fact_insert_query = self._fact_insert_query()
         total_rows = len(df)
         batch_size = 100000  # Ajuster si nécessaire
         num_batches = (total_rows + batch_size - 1) // batch_size
@@ -109,9 +438,10 @@ class DataWarehouseManager:
             for _, row in batch_df.iterrows():
                 date_id = self.date_id_map[(row['DAY'], row['MONTH'], row['YEAR'])]
                 station_id = self.station_id_map[row['STATIONCODE']]
-                weather_fact_data = (
-                    date_id, station_id, row['PRCP'], row['TAVG'], row['TMAX'], row['TMIN'], row['SNWD'], row['PGTM'],
-                    row['SNOW'], row['WDFG'], row['WSFG'])
+                partition_key = (row['YEAR'],) if self.partition_years else ()
+                weather_fact_data = (date_id, station_id) + partition_key + (
+                    row['PRCP'], row['TAVG'], row['TMAX'], row['TMIN'], row['SNWD'], row['PGTM'], row['SNOW'],
+                    row['WDFG'], row['WSFG'])
                 batch_data.append(weather_fact_data)
 
             self.cursor.executemany(weather_fact_insert_query, batch_data)
@@ -122,12 +452,786 @@ class DataWarehouseManager:
 
             batch_count += 1
 
-    def load_data_warehouse(self, csv_file):
-        df = pd.read_csv(csv_file, sep=',')
-        self.create_tables()
-        self.insert_date_dim(df)
-        self.insert_station_dim(df)
-        self.insert_fact_weather(df)
+    def _select_frame(self, query, columns=None, params=None):
+        self.cursor.execute(query, params)
+        rows = self.cursor.fetchall()
+        if columns is None:
+            columns = [description[0] for description in self.cursor.description]
+        # Le curseur peut renvoyer des dictionnaires (DictCursor) ou des tuples
+        if rows and isinstance(rows[0], dict):
+            rows = [tuple(row.values()) for row in rows]
+        return pd.DataFrame(list(rows), columns=columns)
+
+    @staticmethod
+    def _to_db_rows(frame):
+        # Convertir en objets Python natifs et remplacer les NaN par NULL
+        frame = frame.astype(object)
+        return frame.where(frame.notna(), None).values.tolist()
+
+    def _executemany_in_batches(self, query, rows, batch_size):
+        # pymysql regroupe executemany en INSERT multi-lignes ; un seul commit par lot
+        for batch_start in range(0, len(rows), batch_size):
+            self.cursor.executemany(query, rows[batch_start:batch_start + batch_size])
+            self.conn.commit()
+
+    def _register_date_ids(self, date_dim_df):
+        if not self.date_dim_df.empty:
+            date_dim_df = pd.concat([self.date_dim_df, date_dim_df], ignore_index=True)
+        self.date_dim_df = date_dim_df.drop_duplicates(subset=DATE_COLUMNS, keep='last').astype('int64')
+        self.date_id_map.update(zip(map(tuple, date_dim_df[DATE_COLUMNS].values.tolist()),
+                                    date_dim_df['date_id'].tolist()))
+
+    def _register_station_ids(self, station_dim_df):
+        if not self.station_dim_df.empty:
+            station_dim_df = pd.concat([self.station_dim_df, station_dim_df], ignore_index=True)
+        self.station_dim_df = station_dim_df.drop_duplicates(subset='STATIONCODE', keep='last') \
+            .astype({'station_id': 'int64'})
+        self.station_id_map.update(zip(station_dim_df['STATIONCODE'], station_dim_df['station_id'].tolist()))
+
+    def bulk_insert_date_dim(self, df, batch_size=10000):
+        date_dim_insert_query = """
+        INSERT INTO DateDim (day, month, year) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE date_id = date_id
+        """
+        date_dim_data = df[DATE_COLUMNS].drop_duplicates()
+        if not self.date_dim_df.empty:
+            # N'insérer que les dates jamais vues (chargement par morceaux)
+            known = pd.MultiIndex.from_frame(self.date_dim_df[DATE_COLUMNS])
+            date_dim_data = date_dim_data[~pd.MultiIndex.from_frame(date_dim_data).isin(known)]
+        if date_dim_data.empty:
+            return
+        last_date_id = int(self.date_dim_df['date_id'].max()) if not self.date_dim_df.empty else 0
+        date_dim_data = date_dim_data.sort_values(['YEAR', 'MONTH', 'DAY'])
+        self._executemany_in_batches(date_dim_insert_query, self._to_db_rows(date_dim_data), batch_size)
+        # Relire les identifiants générés plutôt que de dépendre de lastrowid ligne par ligne
+        self._register_date_ids(self._select_frame("SELECT date_id, day, month, year FROM DateDim WHERE date_id > %s",
+                                                   ['date_id'] + DATE_COLUMNS, (last_date_id,)))
+
+    def hydrate_key_maps(self):
+        # Reconstruire les cartes de clés depuis l'entrepôt existant (chargement incrémental)
+        self.date_id_map, self.station_id_map = {}, {}
+        self.date_dim_df = pd.DataFrame(columns=['date_id'] + DATE_COLUMNS)
+        self.station_dim_df = pd.DataFrame(columns=['station_id', 'STATIONCODE'])
+        date_dim_df = self._select_frame("SELECT date_id, day, month, year FROM DateDim", ['date_id'] + DATE_COLUMNS)
+        if not date_dim_df.empty:
+            self._register_date_ids(date_dim_df)
+        station_dim_df = self._select_frame("SELECT station_id, station_code FROM StationDim",
+                                            ['station_id', 'STATIONCODE'])
+        if not station_dim_df.empty:
+            self._register_station_ids(station_dim_df)
+
+    def bulk_insert_station_dim(self, df, batch_size=10000, update_existing=False):
+        # Upsert sur la clé naturelle station_code : les attributs des stations connues sont mis à jour
+        station_dim_insert_query = """
+        INSERT INTO StationDim (station_code, station_city, station_country, latitude, longitude, elevation)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE station_city = VALUES(station_city), station_country = VALUES(station_country),
+            latitude = VALUES(latitude), longitude = VALUES(longitude), elevation = VALUES(elevation)
+        """
+        station_dim_data = df[STATION_COLUMNS].drop_duplicates(subset='STATIONCODE', keep='last')
+        if not update_existing:
+            station_dim_data = station_dim_data[
+                ~station_dim_data['STATIONCODE'].isin(self.station_dim_df['STATIONCODE'])]
+        if station_dim_data.empty:
+            return
+        last_station_id = int(self.station_dim_df['station_id'].max()) if not self.station_dim_df.empty else 0
+        self._executemany_in_batches(station_dim_insert_query, self._to_db_rows(station_dim_data), batch_size)
+        self._register_station_ids(self._select_frame(
+            "SELECT station_id, station_code FROM StationDim WHERE station_id > %s", ['station_id', 'STATIONCODE'],
+            (last_station_id,)))
+
+    def resolve_fact_rows(self, df):
+        # Résoudre les clés de substitution par jointures vectorisées au lieu de recherches ligne par ligne
+        facts = df[DATE_COLUMNS + ['STATIONCODE'] + MEASURE_COLUMNS] \
+            .merge(self.date_dim_df, on=DATE_COLUMNS, how='left') \
+            .merge(self.station_dim_df, on='STATIONCODE', how='left')
+        unresolved = facts['date_id'].isna() | facts['station_id'].isna()
+        if unresolved.any():
+            raise KeyError(f"{int(unresolved.sum())} lignes sans date ou station correspondante dans les dimensions")
+        return facts[self._fact_columns()].astype({'date_id': 'int64', 'station_id': 'int64'})
+
+    def _check_unique_facts(self, chunk, seen_keys):
+        # Sans uq_fact_date_station (index différés), un doublon (station, date) du CSV ne serait détecté qu'à la
+        # création de l'index, en fin de chargement : le morceau est refusé avant l'insertion de ses faits
+        station_positions = pd.Index(self.station_dim_df['STATIONCODE']).get_indexer(chunk['STATIONCODE'])
+        station_ids = self.station_dim_df['station_id'].to_numpy(np.int64)[station_positions]
+        date_keys = (chunk['YEAR'].to_numpy(np.int64) * 10000 + chunk['MONTH'].to_numpy(np.int64) * 100
+                     + chunk['DAY'].to_numpy(np.int64))
+        duplicated = seen_keys.add(station_ids * 100_000_000 + date_keys)
+        if duplicated.any():
+            raise DuplicateFactError(chunk.loc[duplicated, ['STATIONCODE'] + DATE_COLUMNS])
+
+    def _fact_columns(self):
+        # Colonnes du lot de faits ; leur nom en minuscules est celui de la colonne de WeatherFact
+        if self.partition_years:
+            return ['date_id', 'station_id', 'YEAR'] + MEASURE_COLUMNS
+        return FACT_COLUMNS
+
+    def _fact_insert_query(self, on_duplicate=None):
+        # on_duplicate : None (erreur sur doublon), 'skip' (conserver l'existant) ou 'replace' (écraser)
+        columns = [column.lower() for column in self._fact_columns()]
+        weather_fact_insert_query = f"""
+        INSERT INTO WeatherFact ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+        """
+        if on_duplicate == 'skip':
+            weather_fact_insert_query += "ON DUPLICATE KEY UPDATE weather_id = weather_id"
+        elif on_duplicate == 'replace':
+            weather_fact_insert_query += "ON DUPLICATE KEY UPDATE " + ", ".join(
+                f"{column} = VALUES({column})" for column in map(str.lower, MEASURE_COLUMNS))
+        elif on_duplicate is not None:
+            raise ValueError(f"on_duplicate inconnu : {on_duplicate!r}")
+        return weather_fact_insert_query
+
+    def bulk_insert_fact_weather(self, df, batch_size=100000, use_load_data=False, on_duplicate=None,
+                                 commit_per_batch=True):
+        weather_fact_insert_query = self._fact_insert_query(on_duplicate)
+        total_rows = len(df)
+        start_time = time.perf_counter()
+
+        for batch_start in range(0, total_rows, batch_size):
+            batch_end = min(batch_start + batch_size, total_rows)
+            facts = self.resolve_fact_rows(df.iloc[batch_start:batch_end])
+            if use_load_data:
+                self._load_data_infile(facts, on_duplicate)
+            else:
+                self.cursor.executemany(weather_fact_insert_query, self._to_db_rows(facts))
+            if commit_per_batch:
+                self.conn.commit()
+
+            elapsed = time.perf_counter() - start_time
+            print(f"{total_rows - batch_end} lignes restantes, {batch_end / elapsed:.0f} lignes/s.")
+
+        elapsed = time.perf_counter() - start_time
+        print(f"{total_rows} lignes de faits insérées en {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):.0f} lignes/s).")
+        return total_rows
+
+    def _load_data_infile(self, facts, on_duplicate=None):
+        # Mettre le lot en fichier temporaire ; \N représente NULL pour MySQL
+        staged_file = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False)
+        try:
+            facts.to_csv(staged_file, sep=',', header=False, index=False, na_rep='\\N', lineterminator='\n')
+            staged_file.close()
+            duplicate_clause = {None: '', 'skip': 'IGNORE', 'replace': 'REPLACE'}[on_duplicate]
+            self.cursor.execute(f"""
+            LOAD DATA LOCAL INFILE '{staged_file.name}' {duplicate_clause} INTO TABLE WeatherFact
+            FIELDS TERMINATED BY ',' LINES TERMINATED BY '\\n'
+            ({', '.join(column.lower() for column in facts.columns)})
+            """)
+        finally:
+            staged_file.close()
+            os.remove(staged_file.name)
+
+    def stream_data_warehouse(self, csv_file, chunksize=500000, batch_size=100000, use_load_data=False,
+                              on_duplicate=None, update_existing=False):
+        # Lire le CSV par morceaux : la mémoire maximale dépend de chunksize, pas de la taille du fichier
+        total_rows = 0
+        touched_months, touched_station_ids = set(), set()
+        seen_keys = FactKeySet() if on_duplicate is None else None
+        start_time = time.perf_counter()
+        for chunk in self._timed_chunks(pd.read_csv(csv_file, sep=',', usecols=list(CSV_DTYPES), dtype=CSV_DTYPES,
+                                                    chunksize=chunksize)):
+            with self.timed_phase('dimensions') as span:
+                self.bulk_insert_date_dim(chunk)
+                self.bulk_insert_station_dim(chunk, update_existing=update_existing)
+                span['rows'] = len(chunk)
+            with self.timed_phase('facts') as span:
+                if seen_keys is not None:
+                    self._check_unique_facts(chunk, seen_keys)
+                span['rows'] = self.bulk_insert_fact_weather(chunk, batch_size, use_load_data, on_duplicate)
+                total_rows += span['rows']
+            self._track_touched_groups(chunk, touched_months, touched_station_ids)
+            del chunk
+        elapsed = time.perf_counter() - start_time
+        print(f"Chargement en flux terminé : {total_rows} lignes en {elapsed:.1f}s "
+              f"({total_rows / max(elapsed, 1e-9):.0f} lignes/s).")
+        return touched_months, touched_station_ids
+
+    @contextmanager
+    def timed_phase(self, name):
+        # Durées cumulées par phase du dernier chargement (lues par les benchmarks), exportées aussi comme
+        # spans load.<phase> ; le bloc peut renseigner span['rows']
+        start_time = time.perf_counter()
+        try:
+            with instrumentation.span(f'load.{name}') as span:
+                yield span
+        finally:
+            self.phase_timings[name] = self.phase_timings.get(name, 0.0) + time.perf_counter() - start_time
+
+    def _timed_chunks(self, reader):
+        # Compter la lecture/analyse du CSV comme une phase à part entière
+        iterator = iter(reader)
+        while True:
+            with self.timed_phase('read_csv') as span:
+                chunk = next(iterator, None)
+                if chunk is not None:
+                    span['rows'] = len(chunk)
+                    span['nbytes'] = chunk.memory_usage(index=False).sum()
+            if chunk is None:
+                return
+            yield chunk
+
+    def _track_touched_groups(self, chunk, touched_months, touched_station_ids):
+        # Mémoriser les groupes (station, année, mois) touchés pour le rafraîchissement des agrégats
+        touched_months.update(map(tuple, chunk[['YEAR', 'MONTH']].drop_duplicates().values.tolist()))
+        touched_station_ids.update(self.station_dim_df.loc[
+            self.station_dim_df['STATIONCODE'].isin(chunk['STATIONCODE'].unique()), 'station_id'].tolist())
+
+    def load_dimensions(self, csv_file, chunksize=500000, update_existing=False):
+        # Premier passage sur les seules colonnes de dimensions : toutes les clés sont connues avant les faits
+        dimension_dtypes = {column: CSV_DTYPES[column] for column in DATE_COLUMNS + STATION_COLUMNS}
+        touched_months, touched_station_ids = set(), set()
+        for chunk in self._timed_chunks(pd.read_csv(csv_file, sep=',', usecols=list(dimension_dtypes),
+                                                    dtype=dimension_dtypes, chunksize=chunksize)):
+            with self.timed_phase('dimensions') as span:
+                self.bulk_insert_date_dim(chunk)
+                self.bulk_insert_station_dim(chunk, update_existing=update_existing)
+                span['rows'] = len(chunk)
+            self._track_touched_groups(chunk, touched_months, touched_station_ids)
+        return touched_months, touched_station_ids
+
+    def _connection_settings(self):
+        return {'host': self.host, 'username': self.username, 'password': self.password, 'database': self.database,
+                'charset': self.charset, 'cursorclass': self.cursorclass, 'local_infile': self.local_infile,
+                'partition_years': self.partition_years}
+
+    def parallel_stream_data_warehouse(self, csv_file, workers=4, chunksize=200000, batch_size=50000,
+                                       use_load_data=False, on_duplicate=None, update_existing=False):
+        # Les dimensions sont chargées d'abord ; chaque partition de lignes part ensuite vers un processus qui
+        # possède sa propre connexion et une copie en lecture seule des cartes de clés. Une partition est une
+        # transaction : en cas d'échec elle est entièrement annulée et signalée par ParallelLoadError.
+        touched_groups = self.load_dimensions(csv_file, chunksize, update_existing)
+        seen_keys = FactKeySet() if on_duplicate is None else None
+        total_rows = 0
+        failures = []
+        partitions = {}
+        pending = set()
+        next_row = 0
+        start_time = time.perf_counter()
+
+        def collect(done):
+            loaded_rows = 0
+            for future in done:
+                partition_id, first_row, row_count = partitions.pop(future)
+                try:
+                    loaded_rows += future.result()
+                except Exception as error:
+                    failures.append((partition_id, first_row, row_count, repr(error)))
+            return loaded_rows
+
+        with self.timed_phase('facts') as span, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_fact_worker,
+                                    initargs=(self._connection_settings(), self.date_dim_df, self.station_dim_df)) \
+                as executor:
+            for partition_id, chunk in enumerate(pd.read_csv(csv_file, sep=',', usecols=list(CSV_DTYPES),
+                                                             dtype=CSV_DTYPES, chunksize=chunksize)):
+                # Au plus deux partitions en vol par processus : la mémoire reste bornée par workers x chunksize
+                while len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    total_rows += collect(done)
+                if failures:
+                    break
+                if seen_keys is not None:
+                    self._check_unique_facts(chunk, seen_keys)
+                future = executor.submit(_load_fact_partition, chunk, batch_size, use_load_data, on_duplicate)
+                partitions[future] = (partition_id, next_row, len(chunk))
+                pending.add(future)
+                next_row += len(chunk)
+            else:
+                next_row = None
+            total_rows += collect(wait(pending)[0])
+            span['rows'] = total_rows
+
+        elapsed = time.perf_counter() - start_time
+        print(f"Chargement parallèle ({workers} processus) : {total_rows} lignes en {elapsed:.1f}s "
+              f"({total_rows / max(elapsed, 1e-9):.0f} lignes/s).")
+        if failures:
+            raise ParallelLoadError(sorted(failures), next_row)
+        return touched_groups
+
+    def refresh_monthly_rollup(self, months=None, station_ids=None, months_per_statement=120):
+        # Recalculer les agrégats depuis les faits : exact même après un remplacement de faits existants
+        select_columns = ", ".join(f"SUM(w.{column.lower()}), COUNT(w.{column.lower()})"
+                                   for column in MEASURE_COLUMNS)
+        update_columns = ", ".join(f"{column} = VALUES({column})" for column in ROLLUP_COLUMNS)
+        station_filter, station_params = "", []
+        if station_ids:
+            station_filter = f"AND w.station_id IN ({', '.join(['%s'] * len(station_ids))})"
+            station_params = sorted(station_ids)
+        month_groups = [None]
+        if months is not None:
+            months = sorted(months)
+            month_groups = [months[i:i + months_per_statement] for i in range(0, len(months), months_per_statement)]
+        for month_group in month_groups:
+            month_filter, month_params = "", []
+            if month_group is not None and not self.date_dim_df.empty:
+                # Mois -> intervalles de date_id : parcours par plage de l'index (date_id, station_id) des faits
+                date_ranges = self.date_index().months_id_ranges(month_group)
+                if not date_ranges:
+                    continue
+                month_filter = f"AND ({' OR '.join(['w.date_id BETWEEN %s AND %s'] * len(date_ranges))})"
+                month_params = [value for date_range in date_ranges for value in date_range]
+            elif month_group is not None:
+                month_filter = f"AND (d.year, d.month) IN ({', '.join(['(%s, %s)'] * len(month_group))})"
+                month_params = [value for year_month in month_group for value in year_month]
+            self.cursor.execute(f"""
+            INSERT INTO WeatherMonthlyAgg (station_id, year, month, {', '.join(ROLLUP_COLUMNS)})
+            SELECT w.station_id, d.year, d.month, {select_columns}
+            FROM WeatherFact w
+            JOIN DateDim d ON w.date_id = d.date_id
+            WHERE 1 = 1 {month_filter} {station_filter}
+            GROUP BY w.station_id, d.year, d.month
+            ON DUPLICATE KEY UPDATE {update_columns}
+            """, [int(value) for value in month_params + station_params])
+            self.conn.commit()
+
+    def refresh_climatology(self, months=None, station_ids=None, rebuild=False, chunksize=500000):
+        # Normales des moyennes mensuelles, lues dans WeatherMonthlyAgg (à rafraîchir avant). Avec months (mois
+        # (année, mois) touchés), seules ces lignes d'agrégats sont lues : une année postérieure à last_year est
+        # fusionnée aux normales existantes, une année déjà incluse (faits remplacés ou complétés) fait recalculer
+        # exactement ce (station, mois). Sinon, ou avec rebuild=True, les stations données (toutes si None) sont
+        # recalculées en un passage trié sur les agrégats
+        measure_columns = [column.lower() for column in MEASURE_COLUMNS]
+        station_ids = sorted(station_ids) if station_ids is not None else None
+        station_filter, station_params = self._station_id_filter(station_ids)
+        if months is None or rebuild:
+            frames = self._iter_rollup_frames(f"1 = 1 {station_filter}", station_params, chunksize)
+            parts = [monthly_mean_stats(frame, measure_columns) for frame in complete_station_frames(frames)]
+            # Un seul commit : les stations recalculées ne restent jamais à moitié vides
+            self.cursor.execute(f"DELETE FROM WeatherClimatology WHERE 1 = 1 {station_filter}", station_params)
+            return self._upsert_climatology(parts)
+
+        months = sorted(months)
+        frames = []
+        for batch_start in range(0, len(months), 120):
+            month_group = months[batch_start:batch_start + 120]
+            frames.extend(self._iter_rollup_frames(
+                f"(year, month) IN ({', '.join(['(%s, %s)'] * len(month_group))}) {station_filter}",
+                [int(value) for year_month in month_group for value in year_month] + station_params, chunksize))
+        if not frames:
+            return 0
+        touched = pd.concat(frames, ignore_index=True)
+        touched_station_ids = sorted(touched['station_id'].unique().tolist())
+        existing = self._select_frame(
+            f"SELECT {', '.join(CLIMATOLOGY_TABLE_COLUMNS)} FROM WeatherClimatology "
+            f"WHERE 1 = 1 {self._station_id_filter(touched_station_ids)[0]}", CLIMATOLOGY_TABLE_COLUMNS,
+            touched_station_ids)
+        existing = existing.astype({column: np.float64 for column in CLIMATOLOGY_COLUMNS}) \
+            .astype({column: np.int64 for column in CLIMATOLOGY_KEYS + ['last_year']})
+        # Année déjà comptée dans les normales : la fusion ne sait pas retirer son ancienne moyenne
+        last_year = touched[CLIMATOLOGY_KEYS].merge(existing[CLIMATOLOGY_KEYS + ['last_year']], how='left',
+                                                    on=CLIMATOLOGY_KEYS)['last_year'].to_numpy(np.float64)
+        revised = touched.loc[touched['year'].to_numpy() <= last_year, CLIMATOLOGY_KEYS].drop_duplicates()
+        revised_keys = pd.MultiIndex.from_frame(revised)
+        appended = touched[~pd.MultiIndex.from_frame(touched[CLIMATOLOGY_KEYS]).isin(revised_keys)]
+        parts = []
+        if not appended.empty:
+            appended_stats = monthly_mean_stats(appended, measure_columns)
+            appended_keys = pd.MultiIndex.from_frame(appended_stats[CLIMATOLOGY_KEYS])
+            parts.append(merge_climatology(existing[pd.MultiIndex.from_frame(existing[CLIMATOLOGY_KEYS])
+                                                    .isin(appended_keys)], appended_stats, measure_columns))
+        if not revised.empty:
+            revised_station_ids = sorted(revised['station_id'].unique().tolist())
+            revised_months = sorted(revised['month'].unique().tolist())
+            history = pd.concat(list(self._iter_rollup_frames(
+                f"month IN ({', '.join(['%s'] * len(revised_months))}) "
+                f"{self._station_id_filter(revised_station_ids)[0]}",
+                [int(month) for month in revised_months] + revised_station_ids, chunksize)), ignore_index=True)
+            history = history[pd.MultiIndex.from_frame(history[CLIMATOLOGY_KEYS]).isin(revised_keys)]
+            parts.append(monthly_mean_stats(history, measure_columns))
+        return self._upsert_climatology(parts)
+
+    def _upsert_climatology(self, parts):
+        rows = self._to_db_rows(pd.concat(parts, ignore_index=True)[CLIMATOLOGY_TABLE_COLUMNS]) if parts else []
+        update_columns = ", ".join(f"{column} = VALUES({column})" for column in CLIMATOLOGY_TABLE_COLUMNS[len(CLIMATOLOGY_KEYS):])
+        climatology_insert_query = f"""
+        INSERT INTO WeatherClimatology ({', '.join(CLIMATOLOGY_TABLE_COLUMNS)})
+        VALUES ({', '.join(['%s'] * len(CLIMATOLOGY_TABLE_COLUMNS))})
+        ON DUPLICATE KEY UPDATE {update_columns}
+        """
+        for batch_start in range(0, len(rows), 10000):
+            self.cursor.executemany(climatology_insert_query, rows[batch_start:batch_start + 10000])
+        self.conn.commit()
+        return len(rows)
+
+    @staticmethod
+    def _station_id_filter(station_ids):
+        if station_ids is None:
+            return "", []
+        if not station_ids:
+            return "AND 1 = 0", []
+        return f"AND station_id IN ({', '.join(['%s'] * len(station_ids))})", list(station_ids)
+
+    def _iter_rollup_frames(self, where, params, chunksize):
+        # Lignes d'agrégats mensuels lues en flux, dans l'ordre de la clé primaire (station, année, mois)
+        columns = ['station_id', 'year', 'month'] + ROLLUP_COLUMNS
+        with self.conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(f"""
+            SELECT {', '.join(columns)}
+            FROM WeatherMonthlyAgg
+            WHERE {where}
+            ORDER BY station_id, year, month
+            """, params)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=columns).astype(
+                    {column: np.float64 for column in ROLLUP_COLUMNS})
+
+    def warehouse_checksums(self):
+        # Agrégats de contrôle par (station, année) calculés dans la base en un seul GROUP BY
+        measure_columns = [column.lower() for column in MEASURE_COLUMNS]
+        if self.station_dim_df.empty:
+            self.hydrate_key_maps()
+        checksums = self._select_frame(warehouse_checksum_query(measure_columns))
+        station_codes = self.station_dim_df.set_index('station_id')['STATIONCODE']
+        checksums.insert(0, 'station_code', checksums['station_id'].astype(np.int64).map(station_codes))
+        return checksums.drop(columns='station_id').astype({'year': np.int64}) \
+            .set_index(PARTITION_KEYS)[checksum_columns(measure_columns)].astype(np.float64).sort_index()
+
+    def verify_load(self, csv_file, chunksize=500000):
+        # Rapprochement du CSV et de WeatherFact par (station, année) : un passage en flux sur le CSV, un
+        # GROUP BY dans la base. La source doit contenir tout l'historique des partitions qu'elle couvre : un delta
+        # incrémental (quelques jours d'une année) ferait passer chaque partition touchée pour 'mismatch', et
+        # reload_partitions effacerait l'année entière. Les partitions de l'entrepôt absentes de la source sont
+        # signalées ('extra') mais jamais rechargées
+        start_time = time.perf_counter()
+        measure_columns = [column.lower() for column in MEASURE_COLUMNS]
+        checksum_dtypes = {column: CSV_DTYPES[column] for column in ['STATIONCODE'] + DATE_COLUMNS + MEASURE_COLUMNS}
+        source = source_checksums(pd.read_csv(csv_file, sep=',', usecols=list(checksum_dtypes), dtype=checksum_dtypes,
+                                              chunksize=chunksize), measure_columns)
+        report = compare_checksums(source, self.warehouse_checksums())
+        self.verification_report = report
+        counts = ", ".join(f"{status} : {count}" for status, count in report['status'].value_counts().items())
+        print(f"Vérification : {len(source)} partitions (station, année) comparées en "
+              f"{time.perf_counter() - start_time:.1f}s, {len(report)} en écart{f' ({counts})' if counts else ''}.")
+        return report
+
+    def reload_partitions(self, csv_file, report, chunksize=500000, batch_size=100000, parquet_dir=None,
+                          snapshot_dir=None):
+        # Recharger depuis le CSV les seules partitions en écart ('missing', 'mismatch') d'un rapport de
+        # verify_load (fait sur le CSV complet, jamais sur un delta) : leurs faits et leurs agrégats mensuels sont
+        # supprimés, puis les faits réinsérés et agrégats et normales recalculés pour elles. L'export Parquet et
+        # l'instantané donnés sont réécrits, sans quoi DuckDB et l'instantané serviraient l'entrepôt d'avant
+        partitions = report.loc[report['status'] != 'extra', PARTITION_KEYS].astype({'year': np.int64})
+        if partitions.empty:
+            return 0
+        if self.date_dim_df.empty or self.station_dim_df.empty:
+            self.hydrate_key_maps()
+        dates = self.date_index()
+        station_ids_by_code = self.station_dim_df.set_index('STATIONCODE')['station_id']
+        deleted_station_ids = set()
+        for year, year_partitions in partitions.groupby('year'):
+            station_ids = station_ids_by_code.reindex(year_partitions['station_code']).dropna().astype(int).tolist()
+            if not station_ids:
+                continue
+            station_placeholders = ', '.join(['%s'] * len(station_ids))
+            # refresh_monthly_rollup ne fait que des upserts : un mois devenu vide garderait sa ligne d'agrégat
+            self.cursor.execute(f"""
+            DELETE FROM WeatherMonthlyAgg
+            WHERE station_id IN ({station_placeholders}) AND year = %s
+            """, station_ids + [int(year)])
+            deleted_station_ids.update(station_ids)
+            date_ranges = dates.id_ranges((year, year))
+            if not date_ranges:
+                continue
+            self.cursor.execute(f"""
+            DELETE FROM WeatherFact
+            WHERE station_id IN ({station_placeholders})
+              AND ({' OR '.join(['date_id BETWEEN %s AND %s'] * len(date_ranges))})
+            """, station_ids + [int(value) for date_range in date_ranges for value in date_range])
+        self.conn.commit()
+
+        reloaded_rows = 0
+        touched_months, touched_station_ids = set(), set(deleted_station_ids)
+        keys = pd.MultiIndex.from_frame(partitions)
+        for chunk in pd.read_csv(csv_file, sep=',', usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=chunksize):
+            chunk = chunk[pd.MultiIndex.from_arrays([chunk['STATIONCODE'], chunk['YEAR'].astype(np.int64)])
+                          .isin(keys)]
+            if chunk.empty:
+                continue
+            # Partitions absentes : leurs dates ou leur station peuvent aussi manquer aux dimensions
+            self.bulk_insert_date_dim(chunk)
+            self.bulk_insert_station_dim(chunk)
+            reloaded_rows += self.bulk_insert_fact_weather(chunk, batch_size, on_duplicate='skip')
+            self._track_touched_groups(chunk, touched_months, touched_station_ids)
+        self.refresh_monthly_rollup(touched_months, touched_station_ids)
+        # Lignes d'agrégats supprimées : la fusion ne sait pas les retirer, ces stations sont recalculées
+        self.refresh_climatology(station_ids=touched_station_ids, rebuild=True)
+        self.record_load()
+        print(f"{len(partitions)} partitions rechargées ({reloaded_rows} lignes).")
+        if parquet_dir:
+            self.export_parquet(parquet_dir, chunksize)
+        if snapshot_dir:
+            self.export_fact_snapshot(snapshot_dir, chunksize)
+        return reloaded_rows
+
+    def export_parquet(self, output_dir, chunksize=500000):
+        # Export du schéma en étoile en Parquet pour un moteur colonnaire embarqué (voir Backend.DuckDBBackend)
+        start_time = time.perf_counter()
+        load_version = int(self._select_frame("SELECT COALESCE(MAX(load_id), 0) FROM LoadHistory").iloc[0, 0])
+        exported_rows = write_parquet_warehouse(
+            output_dir, self._select_frame("SELECT date_id, day, month, year FROM DateDim"),
+            self._select_frame("SELECT * FROM StationDim"), self._select_frame("SELECT * FROM WeatherMonthlyAgg"),
+            self._select_frame("SELECT * FROM WeatherClimatology"), self._iter_fact_frames(chunksize), load_version)
+        print(f"Export Parquet : {exported_rows} faits écrits dans {output_dir} "
+              f"en {time.perf_counter() - start_time:.1f}s.")
+
+    def _iter_fact_frames(self, chunksize):
+        measure_columns = [column.lower() for column in MEASURE_COLUMNS]
+        # Curseur non bufferisé : les faits sont lus et écrits par lots, sans tout charger en mémoire
+        with self.conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(f"""
+            SELECT w.weather_id, w.date_id, w.station_id, d.year, {', '.join('w.' + c for c in measure_columns)}
+            FROM WeatherFact w
+            JOIN DateDim d ON w.date_id = d.date_id
+            """)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=PARQUET_FACT_COLUMNS)
+
+    def export_fact_snapshot(self, output_dir, chunksize=500000):
+        # Instantané mmap des faits (voir Snapshot.py), lu dans une transaction cohérente : dimensions,
+        # comptage et parcours trié voient exactement les mêmes lignes
+        start_time = time.perf_counter()
+        measure_columns = [column.lower() for column in MEASURE_COLUMNS]
+        self.cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        try:
+            load_version = int(self._select_frame("SELECT COALESCE(MAX(load_id), 0) FROM LoadHistory").iloc[0, 0])
+            total_rows = int(self._select_frame("SELECT COUNT(*) FROM WeatherFact").iloc[0, 0])
+            write_fact_snapshot(output_dir, self._select_frame(STATION_INDEX_QUERY),
+                                self._select_frame(DATE_INDEX_QUERY), self._iter_sorted_fact_frames(chunksize),
+                                total_rows, measure_columns, load_version)
+        finally:
+            self.conn.commit()
+        print(f"Instantané des faits : {total_rows} lignes écrites dans {output_dir} "
+              f"en {time.perf_counter() - start_time:.1f}s.")
+
+    def _iter_sorted_fact_frames(self, chunksize):
+        measure_columns = [column.lower() for column in MEASURE_COLUMNS]
+        with self.conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            # Ordre de l'index ix_fact_station_date : pas de tri côté serveur
+            cursor.execute(f"""
+            SELECT station_id, date_id, {', '.join(measure_columns)}
+            FROM WeatherFact
+            ORDER BY station_id, date_id
+            """)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=['station_id', 'date_id'] + measure_columns).astype(
+                    {column: np.float32 for column in measure_columns})
+
+    def load_data_warehouse(self, csv_file, bulk=False, batch_size=100000, use_load_data=False, chunksize=None,
+                            incremental=False, on_duplicate='skip', workers=1, parquet_dir=None, snapshot_dir=None,
+                            verify=False):
+        if verify and incremental:
+            # Un delta ne couvre qu'une partie de chaque partition (station, année) : rapport faux et rechargement
+            # destructeur (voir verify_load)
+            raise ValueError("verify=True exige un chargement complet (incremental=False) depuis tout l'historique")
+        self.phase_timings = {}
+        start_time = time.perf_counter()
+        parallel = workers > 1
+        with self.timed_phase('schema'):
+            # Chargement complet en masse : index secondaires construits une seule fois, après les faits
+            self.create_tables(defer_indexes=not incremental and bool(bulk or chunksize or parallel))
+        if incremental:
+            # Schéma créé seulement s'il manque, cartes de clés reprises depuis l'entrepôt : seul le delta est chargé
+            with self.timed_phase('hydrate_key_maps'):
+                self.hydrate_key_maps()
+            if parallel:
+                touched_months, touched_station_ids = self.parallel_stream_data_warehouse(
+                    csv_file, workers, chunksize or 200000, batch_size, use_load_data, on_duplicate,
+                    update_existing=True)
+            else:
+                touched_months, touched_station_ids = self.stream_data_warehouse(
+                    csv_file, chunksize or 500000, batch_size, use_load_data, on_duplicate, update_existing=True)
+            with self.timed_phase('rollup'):
+                self.refresh_monthly_rollup(touched_months, touched_station_ids)
+            with self.timed_phase('climatology') as span:
+                span['rows'] = self.refresh_climatology(touched_months, touched_station_ids)
+        else:
+            if parallel:
+                self.parallel_stream_data_warehouse(csv_file, workers, chunksize or 200000, batch_size, use_load_data)
+            elif chunksize:
+                self.stream_data_warehouse(csv_file, chunksize, batch_size, use_load_data)
+            else:
+                with self.timed_phase('read_csv') as span:
+                    df = pd.read_csv(csv_file, sep=',')
+                    span['rows'] = len(df)
+                    span['nbytes'] = df.memory_usage(index=False).sum()
+                with self.timed_phase('dimensions') as span:
+                    span['rows'] = len(df)
+                    if bulk:
+                        self.bulk_insert_date_dim(df)
+                        self.bulk_insert_station_dim(df)
+                    else:
+                        self.insert_date_dim(df)
+                        self.insert_station_dim(df)
+                with self.timed_phase('facts') as span:
+                    span['rows'] = len(df)
+                    if bulk:
+                        self._check_unique_facts(df, FactKeySet())
+                        self.bulk_insert_fact_weather(df, batch_size, use_load_data)
+                    else:
+                        self.insert_fact_weather(df)
+                del df
+            with self.timed_phase('indexes'):
+                self.create_indexes()
+            with self.timed_phase('rollup'):
+                self.refresh_monthly_rollup()
+            with self.timed_phase('climatology') as span:
+                span['rows'] = self.refresh_climatology()
+        if verify:
+            # Rapport dans self.verification_report ; reload_partitions(csv_file, rapport) corrige les écarts
+            with self.timed_phase('verify') as span:
+                span['rows'] = len(self.verify_load(csv_file, chunksize or 500000))
+        self.record_load()
+        if parquet_dir:
+            with self.timed_phase('export_parquet'):
+                self.export_parquet(parquet_dir)
+        if snapshot_dir:
+            with self.timed_phase('snapshot'):
+                self.export_fact_snapshot(snapshot_dir)
+        self.phase_timings['total'] = time.perf_counter() - start_time
+
+
+def write_parquet_warehouse(output_dir, date_dim, station_dim, rollup, climatology, fact_frames, load_version):
+    # Faits et agrégats partitionnés par année ; écriture dans un répertoire versionné puis échange atomique
+    # du lien output_dir (voir Snapshot.publish_directory), pour que les lecteurs ne voient jamais un export partiel
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    staging_dir = staging_directory(output_dir)
+    date_dim.to_parquet(os.path.join(staging_dir, 'DateDim.parquet'), index=False)
+    station_dim.to_parquet(os.path.join(staging_dir, 'StationDim.parquet'), index=False)
+    pq.write_to_dataset(pa.Table.from_pandas(rollup, preserve_index=False),
+                        os.path.join(staging_dir, 'WeatherMonthlyAgg'), partition_cols=['year'])
+    climatology.astype({column: np.float64 for column in CLIMATOLOGY_COLUMNS}).to_parquet(
+        os.path.join(staging_dir, 'WeatherClimatology.parquet'), index=False)
+    exported_rows = 0
+    measure_types = {column.lower(): 'float32' for column in MEASURE_COLUMNS}
+    for part, facts in enumerate(fact_frames):
+        pq.write_to_dataset(pa.Table.from_pandas(facts[PARQUET_FACT_COLUMNS].astype(measure_types),
+                                                 preserve_index=False),
+                            os.path.join(staging_dir, 'WeatherFact'), partition_cols=['year'],
+                            basename_template=f"part-{part}-{{i}}.parquet")
+        exported_rows += len(facts)
+    with open(os.path.join(staging_dir, 'load_version.txt'), 'w') as version_file:
+        version_file.write(str(load_version))
+    publish_directory(staging_dir, output_dir)
+    return exported_rows
+
+
+def result_array(column, values):
+    if column in FLOAT32_RESULT_COLUMNS or column in FLOAT64_RESULT_COLUMNS:
+        dtype = np.float32 if column in FLOAT32_RESULT_COLUMNS else np.float64
+        return np.fromiter((np.nan if value is None else value for value in values), dtype, len(values))
+    if column in CATEGORY_RESULT_COLUMNS:
+        return pd.Categorical(values)
+    return np.asarray(values)
+
+
+def concat_result_arrays(column, parts):
+    if not parts:
+        if column in CATEGORY_RESULT_COLUMNS:
+            return pd.Categorical([])
+        return np.empty(0, np.float32 if column in FLOAT32_RESULT_COLUMNS
+                        else np.float64 if column in FLOAT64_RESULT_COLUMNS else object)
+    if column in CATEGORY_RESULT_COLUMNS:
+        return union_categoricals(parts) if len(parts) > 1 else parts[0]
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def typed_result_frame(df):
+    # Même typage pour un résultat déjà colonnaire (DuckDB)
+    for column in df.columns:
+        if column in FLOAT32_RESULT_COLUMNS:
+            df[column] = df[column].astype(np.float32)
+        elif column in FLOAT64_RESULT_COLUMNS:
+            df[column] = df[column].astype(np.float64)
+        elif column in CATEGORY_RESULT_COLUMNS:
+            df[column] = df[column].astype('category')
+    return df
+
+
+class FactKeySet:
+    # Clés (station, date) des faits déjà reçus pendant un chargement, triées : 8 octets par fait
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+
+    def add(self, keys):
+        # Masque des clés déjà vues (plus haut dans le morceau ou dans un morceau précédent) ; les autres sont
+        # mémorisées si le morceau ne contient aucun doublon
+        keys = np.asarray(keys, dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        duplicated = np.zeros(len(keys), dtype=bool)
+        duplicated[order[1:]] = sorted_keys[1:] == sorted_keys[:-1]
+        if len(self.keys):
+            positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            duplicated |= self.keys[positions] == keys
+        if not duplicated.any():
+            # Fusion de deux suites triées : le tri stable (timsort) les reconnaît et reste linéaire
+            self.keys = np.sort(np.concatenate((self.keys, sorted_keys)), kind='stable')
+        return duplicated
+
+
+class DuplicateFactError(ValueError):
+    def __init__(self, duplicates):
+        # duplicates : lignes du CSV (STATIONCODE, DAY, MONTH, YEAR) dont la clé (station, date) est déjà chargée ;
+        # l'index est celui de pandas (numéro de ligne de données)
+        self.duplicates = duplicates
+        examples = ", ".join(f"ligne {row + 2} : {code} {year:04d}-{month:02d}-{day:02d}"
+                             for row, code, day, month, year in duplicates.head(5).itertuples())
+        super().__init__(f"{len(duplicates)} fait(s) en double sur (station, date) dans le CSV ({examples}). "
+                         f"Dédoublonner la source, ou la charger avec incremental=True et "
+                         f"on_duplicate='skip' | 'replace'.")
+
+
+class ParallelLoadError(RuntimeError):
+    def __init__(self, failed_partitions, first_unsubmitted_row=None):
+        # failed_partitions : liste de (partition_id, première ligne, nombre de lignes, erreur)
+        self.failed_partitions = failed_partitions
+        self.first_unsubmitted_row = first_unsubmitted_row
+        details = "; ".join(f"partition {partition_id} (lignes {first_row}-{first_row + row_count - 1}) : {error}"
+                            for partition_id, first_row, row_count, error in failed_partitions)
+        remaining = (f" Lignes non soumises à partir de {first_unsubmitted_row}."
+                     if first_unsubmitted_row is not None else "")
+        super().__init__(f"{len(failed_partitions)} partition(s) annulée(s) : {details}.{remaining} "
+                         f"Relancer avec incremental=True pour compléter le chargement sans doublons.")
+
+
+# État propre à chaque processus du chargement parallèle
+_worker_warehouse = None
+
+
+def _init_fact_worker(connection_settings, date_dim_df, station_dim_df):
+    global _worker_warehouse
+    _worker_warehouse = DataWarehouseManager(**connection_settings)
+    _worker_warehouse._register_date_ids(date_dim_df)
+    _worker_warehouse._register_station_ids(station_dim_df)
+    _worker_warehouse.connect()
+
+
+def _load_fact_partition(chunk, batch_size, use_load_data, on_duplicate):
+    try:
+        rows = _worker_warehouse.bulk_insert_fact_weather(chunk, batch_size, use_load_data, on_duplicate,
+                                                          commit_per_batch=False)
+        _worker_warehouse.conn.commit()
+        return rows
+    except BaseException:
+        try:
+            _worker_warehouse.conn.rollback()
+        except pymysql.Error:
+            # Connexion perdue : le serveur annule la transaction, on repart sur une connexion neuve
+            _worker_warehouse.connect()
+        raise
 
 
 if __name__ == "__main__":
@@ -135,16 +1239,29 @@ if __name__ == "__main__":
 
     username = 'root'
     password = ''
+    incremental = False  # True pour ajouter un delta (ex. un nouveau mois) à un entrepôt existant
+    partition_years = None  # Ex. (1900, 2030) pour partitionner WeatherFact par année
+    workers = 1  # > 1 : faits chargés en parallèle par autant de processus (une connexion chacun)
+    parquet_dir = None  # Ex. 'parquet_warehouse' pour exporter l'entrepôt vers le backend DuckDB du tableau de bord
+    snapshot_dir = None  # Ex. 'fact_snapshot' pour l'instantané mmap lu par le tableau de bord (FACT_SNAPSHOT_DIR)
+    verify = False  # True : rapprochement CSV / entrepôt par (station, année) ; chargement complet uniquement
 
     #########################################################
 
     warehouse_manager = DataWarehouseManager('localhost', username, password, 'Weather_DataWarehouse', 'utf8mb4',
-                                             pymysql.cursors.DictCursor)
+                                             pymysql.cursors.DictCursor, partition_years=partition_years)
     print('----------------------------- Connexion à la base de données -----------------------------\n\n')
     warehouse_manager.connect()
     print('----------------------------- Connecté !!! -----------------------------\n')
     print('----------------------------- Chargement de l\'entrepôt de données -----------------------------\n\n')
-    warehouse_manager.load_data_warehouse('Ready_Data.csv')
+    warehouse_manager.load_data_warehouse('Ready_Data.csv', bulk=True, chunksize=500000, incremental=incremental,
+                                          workers=workers, parquet_dir=parquet_dir,
+                                          snapshot_dir=snapshot_dir, verify=verify)
     print('----------------------------- Entrepôt de données chargé avec succès !!! -----------------------------')
+    if verify and not incremental and len(warehouse_manager.verification_report):
+        print(warehouse_manager.verification_report.to_string(index=False))
+        # Seules les partitions en écart sont rechargées, puis l'export Parquet et l'instantané réécrits
+        warehouse_manager.reload_partitions('Ready_Data.csv', warehouse_manager.verification_report, chunksize=500000,
+                                            parquet_dir=parquet_dir, snapshot_dir=snapshot_dir)
     warehouse_manager.disconnect()
     print('----------------------------- Déconnecté !!! -----------------------------')
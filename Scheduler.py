@@ -0,0 +1,166 @@
+import contextvars
+import threading
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+SESSION_COOKIE = 'fetch_session'
+
+_current_task = contextvars.ContextVar('current_fetch_task', default=None)
+
+
+class FetchError(RuntimeError):
+    pass
+
+
+class FetchCancelled(FetchError):
+    # Requête remplacée par une position plus récente du même utilisateur : son résultat n'est plus attendu
+    pass
+
+
+class FetchTimeout(FetchError):
+    pass
+
+
+class FetchRejected(FetchError):
+    # File d'attente pleine : mieux vaut refuser tout de suite que laisser la latence grimper pour tous
+    pass
+
+
+class FetchTask:
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.cancel_reason = None
+        self._lock = threading.Lock()
+        self._interrupts = []
+
+    @contextmanager
+    def cancellable(self, interrupt):
+        # interrupt() n'est appelable que pendant le bloc : une fois la connexion rendue au pool,
+        # l'annulation ne doit plus pouvoir toucher la requête d'un autre utilisateur
+        with self._lock:
+            if self.cancel_reason is not None:
+                raise FetchCancelled(self.cancel_reason)
+            self._interrupts.append(interrupt)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._interrupts.remove(interrupt)
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.cancel_reason is not None:
+                return
+            self.cancel_reason = reason
+            if self.future is not None:
+                self.future.cancel()
+            for interrupt in self._interrupts:
+                try:
+                    interrupt()
+                except Exception:
+                    # La requête a pu se terminer entre-temps
+                    pass
+
+
+def current_task():
+    # Tâche de fond exécutée par le thread courant (None hors FetchScheduler)
+    return _current_task.get()
+
+
+def session_id():
+    # Un identifiant par navigateur (cookie posé par install_session_cookie), sinon par thread hors requête HTTP
+    from flask import has_request_context, request
+
+    if has_request_context():
+        return request.cookies.get(SESSION_COOKIE) or request.remote_addr
+    return f"thread-{threading.get_ident()}"
+
+
+def install_session_cookie(server):
+    from flask import request
+
+    @server.after_request
+    def set_session_cookie(response):
+        if SESSION_COOKIE not in request.cookies:
+            response.set_cookie(SESSION_COOKIE, uuid.uuid4().hex, httponly=True, samesite='Lax')
+        return response
+
+
+class FetchScheduler:
+    # Exécute les fonctions de lecture dans un pool de threads borné. Une seule requête vivante par
+    # (session, canal) : une nouvelle position de curseur annule la précédente (retirée de la file si elle
+    # n'a pas démarré, interrompue côté base sinon) ; au-delà de `timeout` secondes, la requête est interrompue.
+    def __init__(self, max_workers=4, max_pending=32, timeout=30):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._pending = 0
+        self._counters = {'submitted': 0, 'completed': 0, 'superseded': 0, 'timeouts': 0, 'rejected': 0,
+                          'failed': 0}
+
+    def run(self, channel, func, *args, **kwargs):
+        task = FetchTask((session_id(), channel))
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters['rejected'] += 1
+                raise FetchRejected(f"{self._pending} requêtes en attente (max_pending={self.max_pending})")
+            previous = self._latest.get(task.key)
+            self._latest[task.key] = task
+            self._pending += 1
+            self._counters['submitted'] += 1
+        if previous is not None:
+            previous.cancel('superseded')
+        task.future = self._executor.submit(contextvars.copy_context().run, self._execute, task, func, args, kwargs)
+        task.future.add_done_callback(self._task_done)
+        try:
+            return task.future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            task.cancel('timeout')
+            raise FetchTimeout(f"{channel} : pas de résultat après {self.timeout}s")
+        except CancelledError:
+            raise FetchCancelled(task.cancel_reason or 'cancelled')
+        except Exception as error:
+            # Requête interrompue côté base : l'erreur du pilote traduit l'annulation demandée
+            if task.cancel_reason == 'superseded':
+                raise FetchCancelled(task.cancel_reason) from error
+            if task.cancel_reason == 'timeout':
+                raise FetchTimeout(f"{channel} : pas de résultat après {self.timeout}s") from error
+            raise
+        finally:
+            self._forget(task)
+
+    def _execute(self, task, func, args, kwargs):
+        if task.cancel_reason is not None:
+            raise FetchCancelled(task.cancel_reason)
+        _current_task.set(task)
+        return func(*args, **kwargs)
+
+    def _task_done(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                self._counters['superseded'] += 1
+            elif future.exception() is None:
+                self._counters['completed'] += 1
+
+    def _forget(self, task):
+        with self._lock:
+            if task.cancel_reason == 'superseded' and not task.future.cancelled():
+                self._counters['superseded'] += 1
+            elif task.cancel_reason == 'timeout':
+                self._counters['timeouts'] += 1
+            elif not task.future.cancelled() and task.future.done() and task.future.exception() is not None:
+                self._counters['failed'] += 1
+            if self._latest.get(task.key) is task:
+                del self._latest[task.key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._pending, sessions=len(self._latest),
+                        max_workers=self.max_workers, max_pending=self.max_pending, timeout=self.timeout)
@@ -0,0 +1,242 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from Dimensions import DateIndex, DimensionIndex, StationIndex
+
+# Instantané des faits pour les onglets interactifs : une colonne par fichier .npy, lignes triées par
+# (station_id, date_id), table des décalages par station. Les fichiers sont ouverts en mmap : les workers
+# gunicorn d'une même machine partagent les pages via le cache du système au lieu d'en garder chacun une copie.
+MANIFEST_FILE = 'manifest.json'
+LOAD_VERSION_FILE = 'load_version.txt'
+DIMENSIONS_FILE = 'dimensions.pkl'
+# Lignes lues par bloc dans les réductions : borne la taille des tableaux temporaires, quelle que soit la sélection
+AGGREGATE_BLOCK_ROWS = 1 << 20
+
+
+def staging_directory(output_dir):
+    # Répertoire versionné voisin de output_dir (<nom>.v<suffixe>), publié ensuite par publish_directory
+    output_dir = output_dir.rstrip(os.sep)
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=os.path.basename(output_dir) + '.v', dir=parent)
+
+
+def publish_directory(staging_dir, output_dir):
+    # output_dir est un lien symbolique vers la version courante, remplacé par os.replace (rename atomique) :
+    # un lecteur voit l'ancienne ou la nouvelle version, jamais un répertoire absent. La version précédente est
+    # gardée pour les lecteurs qui viennent de la résoudre ; les plus anciennes sont supprimées
+    output_dir = output_dir.rstrip(os.sep)
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    previous = os.path.basename(os.path.realpath(output_dir)) if os.path.islink(output_dir) else None
+    if os.path.isdir(output_dir) and not os.path.islink(output_dir):
+        # Répertoire réel d'un export antérieur aux liens : renommé en version une seule fois (échange non atomique)
+        legacy_dir = staging_directory(output_dir)
+        os.rmdir(legacy_dir)
+        os.rename(output_dir, legacy_dir)
+        previous = os.path.basename(legacy_dir)
+    link = output_dir + '.link'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(staging_dir), link)
+    os.replace(link, output_dir)
+    prefix = os.path.basename(output_dir) + '.v'
+    for name in os.listdir(parent):
+        if name.startswith(prefix) and name not in (os.path.basename(staging_dir), previous):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+def write_fact_snapshot(output_dir, station_dim, date_dim, fact_frames, total_rows, measure_columns, load_version):
+    # fact_frames : DataFrames (station_id, date_id, mesures) déjà triés par (station_id, date_id) ;
+    # écriture dans un répertoire versionné puis échange atomique, comme l'export Parquet
+    staging_dir = staging_directory(output_dir)
+    columns = {'station_id': np.int32, 'date_id': np.int32, **{column: np.float32 for column in measure_columns}}
+    arrays = {column: np.lib.format.open_memmap(os.path.join(staging_dir, f'{column}.npy'), mode='w+', dtype=dtype,
+                                                shape=(total_rows,))
+              for column, dtype in columns.items()}
+    position = 0
+    for facts in fact_frames:
+        if position + len(facts) > total_rows:
+            raise ValueError(f"Plus de {total_rows} faits reçus : l'entrepôt a changé pendant l'instantané")
+        for column, array in arrays.items():
+            array[position:position + len(facts)] = facts[column].to_numpy()
+        position += len(facts)
+    if position != total_rows:
+        raise ValueError(f"{position} faits reçus au lieu de {total_rows}")
+    station_ids = arrays['station_id']
+    if total_rows and (np.diff(station_ids) < 0).any():
+        raise ValueError("Les faits doivent être triés par (station_id, date_id)")
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(station_ids)) + 1)) if total_rows else np.empty(0, np.int64)
+    np.save(os.path.join(staging_dir, 'stations.npy'), station_ids[starts].astype(np.int64))
+    np.save(os.path.join(staging_dir, 'offsets.npy'), np.append(starts, total_rows).astype(np.int64))
+    for array in arrays.values():
+        array.flush()
+    del arrays, station_ids
+    pd.to_pickle({'stations': station_dim, 'dates': date_dim}, os.path.join(staging_dir, DIMENSIONS_FILE))
+    with open(os.path.join(staging_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump({'load_version': load_version, 'rows': total_rows, 'measures': list(measure_columns)},
+                  manifest_file)
+    with open(os.path.join(staging_dir, LOAD_VERSION_FILE), 'w') as version_file:
+        version_file.write(str(load_version))
+
+    # Les lecteurs qui ont encore l'ancien instantané en mmap le gardent jusqu'à sa fermeture
+    publish_directory(staging_dir, output_dir)
+    return total_rows
+
+
+class FactSnapshot:
+    def __init__(self, path):
+        # Lien résolu une fois : tous les fichiers viennent de la même version, même si un échange a lieu pendant
+        path = os.path.realpath(path)
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.path = path
+        self.load_version = manifest['load_version']
+        self.rows = manifest['rows']
+        self.station_id = np.load(os.path.join(path, 'station_id.npy'), mmap_mode='r')
+        self.date_id = np.load(os.path.join(path, 'date_id.npy'), mmap_mode='r')
+        self.columns = {column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')
+                        for column in manifest['measures']}
+        self.stations = np.load(os.path.join(path, 'stations.npy'))
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        dimensions = pd.read_pickle(os.path.join(path, DIMENSIONS_FILE))
+        self.dimensions = DimensionIndex(StationIndex(dimensions['stations']), DateIndex(dimensions['dates']))
+
+    def dimension_index(self):
+        return self.dimensions
+
+    def _row_slices(self, station_ids=None):
+        # Tranches contiguës de lignes (vues sans copie) : une seule pour toutes les stations,
+        # sinon une par suite de stations consécutives dans l'instantané
+        if station_ids is None:
+            return [(0, len(self.stations) - 1, slice(0, self.rows))] if len(self.stations) else []
+        station_ids = np.unique(np.asarray(station_ids, dtype=np.int64))
+        positions = np.searchsorted(self.stations, station_ids)
+        found = positions < len(self.stations)
+        positions, station_ids = positions[found], station_ids[found]
+        positions = positions[self.stations[positions] == station_ids]
+        runs = np.split(positions, np.flatnonzero(np.diff(positions) != 1) + 1) if len(positions) else []
+        return [(int(run[0]), int(run[-1]), slice(int(self.offsets[run[0]]), int(self.offsets[run[-1] + 1])))
+                for run in runs]
+
+    def _row_blocks(self, station_ids=None, max_rows=AGGREGATE_BLOCK_ROWS):
+        # Tranches découpées en blocs de stations entières d'au plus max_rows lignes (une station plus longue
+        # forme un bloc à elle seule)
+        for first_position, last_position, _ in self._row_slices(station_ids):
+            start = first_position
+            while start <= last_position:
+                end = int(np.searchsorted(self.offsets, self.offsets[start] + max_rows, side='right')) - 2
+                end = min(max(end, start), last_position)
+                yield start, end, slice(int(self.offsets[start]), int(self.offsets[end + 1]))
+                start = end + 1
+
+    def aggregate(self, column, station_ids=None, year_range=None, month_range=None, grain=None):
+        # Sommes et effectifs non nuls de `column` par station (et par année ou mois si grain est donné) :
+        # même forme de résultat que les requêtes sur WeatherMonthlyAgg
+        dates = self.dimensions.dates
+        date_mask = None
+        if year_range is not None or month_range is not None:
+            date_mask = dates.dense(dates.mask(year_range, month_range), False)
+        first_year = int(dates.year.min()) if len(dates) else 0
+        if grain == 'month':
+            n_periods = (int(dates.year.max()) - first_year + 1) * 12 if len(dates) else 1
+            period_of_date = dates.dense((dates.year.astype(np.int64) - first_year) * 12 + dates.month - 1, 0)
+        elif grain == 'year':
+            n_periods = int(dates.year.max()) - first_year + 1 if len(dates) else 1
+            period_of_date = dates.dense(dates.year.astype(np.int64) - first_year, 0)
+        else:
+            n_periods, period_of_date = 1, None
+
+        sums = np.zeros(len(self.stations) * n_periods)
+        counts = np.zeros(len(self.stations) * n_periods, dtype=np.int64)
+        values_column = self.columns[column]
+        for first_position, last_position, rows in self._row_blocks(station_ids):
+            values = values_column[rows]
+            valid = ~np.isnan(values)
+            if date_mask is not None or period_of_date is not None:
+                date_ids = self.date_id[rows]
+            if date_mask is not None:
+                valid &= date_mask[date_ids]
+            window = slice(first_position * n_periods, (last_position + 1) * n_periods)
+            if period_of_date is None:
+                # Une somme par station : réduction directe sur les décalages des stations du bloc
+                starts = self.offsets[first_position:last_position + 1] - rows.start
+                sums[window] += np.add.reduceat(np.where(valid, values, 0).astype(np.float64), starts)
+                counts[window] += np.add.reduceat(valid, starts, dtype=np.int64)
+                continue
+            # Clé locale au bloc : (position de la station - première position) x périodes + période
+            row_positions = np.repeat(np.arange(last_position - first_position + 1),
+                                      np.diff(self.offsets[first_position:last_position + 2]))
+            keys = row_positions[valid] * n_periods + period_of_date[date_ids[valid]]
+            size = (last_position - first_position + 1) * n_periods
+            sums[window] += np.bincount(keys, weights=values[valid], minlength=size)
+            counts[window] += np.bincount(keys, minlength=size)
+
+        present = np.flatnonzero(counts)
+        result = pd.DataFrame({'station_id': self.stations[present // n_periods]})
+        if grain == 'month':
+            result['year'] = first_year + (present % n_periods) // 12
+            result['month'] = (present % n_periods) % 12 + 1
+        elif grain == 'year':
+            result['year'] = first_year + present % n_periods
+        result['value_sum'] = sums[present]
+        result['value_count'] = counts[present].astype(np.float64)
+        return result
+
+    def last_year(self, column, station_ids=None):
+        # Dernière année avec une valeur non nulle de `column` pour ces stations (None si aucune), par blocs
+        dates = self.dimensions.dates
+        year_of_date = dates.dense(dates.year, 0)
+        last_year = None
+        for _, _, rows in self._row_blocks(station_ids):
+            valid = ~np.isnan(self.columns[column][rows])
+            if valid.any():
+                block_last_year = int(year_of_date[self.date_id[rows][valid]].max())
+                last_year = block_last_year if last_year is None else max(last_year, block_last_year)
+        return last_year
+
+    def series(self, column, station_ids=None, year_range=None):
+        # Valeurs journalières non nulles des stations demandées (station_id, date_id, value), limitées à year_range
+        dates = self.dimensions.dates
+        date_mask = dates.dense(dates.mask(year_range), False) if year_range is not None else None
+        parts = []
+        for _, _, rows in self._row_blocks(station_ids):
+            values = self.columns[column][rows]
+            valid = ~np.isnan(values)
+            if date_mask is not None:
+                valid &= date_mask[self.date_id[rows]]
+            parts.append(pd.DataFrame({'station_id': self.station_id[rows][valid], 'date_id': self.date_id[rows][valid],
+                                       'value': values[valid]}))
+        if not parts:
+            return pd.DataFrame({'station_id': np.empty(0, np.int32), 'date_id': np.empty(0, np.int32),
+                                 'value': np.empty(0, np.float32)})
+        return pd.concat(parts, ignore_index=True)
+
+
+class SnapshotReader:
+    # Instantané courant d'un répertoire, rouvert quand un nouveau chargement l'a remplacé
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def load_version(self):
+        try:
+            with open(os.path.join(self.path, LOAD_VERSION_FILE)) as version_file:
+                return int(version_file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def current(self):
+        version = self.load_version()
+        if not version:
+            return None
+        with self._lock:
+            if self._snapshot is None or self._snapshot.load_version != version:
+                self._snapshot = FactSnapshot(self.path)
+            return self._snapshot
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# Rapprochement source / entrepôt par partition (station, année) : nombre de lignes, somme d'une clé de date
+# (mois x 32 + jour, détecte les faits rattachés à une mauvaise date) et, par paramètre, effectif non nul, somme et
+# somme pondérée par la clé de date (détecte des valeurs échangées entre deux jours d'une même partition)
+PARTITION_KEYS = ['station_code', 'year']
+CHECKSUM_SUFFIXES = ('count', 'sum', 'weighted')
+
+
+def checksum_columns(measure_columns):
+    return ['row_count', 'date_checksum'] + [f'{column}_{suffix}' for column in measure_columns
+                                             for suffix in CHECKSUM_SUFFIXES]
+
+
+def partition_checksums(chunk, measure_columns):
+    # chunk : colonnes du CSV (STATIONCODE, YEAR, MONTH, DAY et les paramètres en majuscules)
+    date_key = chunk['MONTH'].to_numpy(np.int64) * 32 + chunk['DAY'].to_numpy(np.int64)
+    checksums = {'station_code': chunk['STATIONCODE'].to_numpy(), 'year': chunk['YEAR'].to_numpy(np.int64),
+                 'row_count': np.ones(len(chunk)), 'date_checksum': date_key.astype(np.float64)}
+    for column in measure_columns:
+        values = chunk[column.upper()].to_numpy(np.float64)
+        present = ~np.isnan(values)
+        checksums[f'{column}_count'] = present.astype(np.float64)
+        checksums[f'{column}_sum'] = np.where(present, values, 0.0)
+        checksums[f'{column}_weighted'] = np.where(present, values * date_key, 0.0)
+    return pd.DataFrame(checksums).groupby(PARTITION_KEYS, sort=False).sum()
+
+
+def source_checksums(chunks, measure_columns):
+    # Un seul passage sur la source : les sommes partielles de chaque morceau s'additionnent
+    partials = [partition_checksums(chunk, measure_columns) for chunk in chunks]
+    if not partials:
+        return pd.DataFrame(columns=checksum_columns(measure_columns),
+                            index=pd.MultiIndex.from_arrays([[], []], names=PARTITION_KEYS))
+    return pd.concat(partials).groupby(level=PARTITION_KEYS, sort=True).sum()
+
+
+def warehouse_checksum_query(measure_columns):
+    # Mêmes agrégats calculés dans la base, par station_id (le code est rattaché en mémoire)
+    checksums = ", ".join(f"COUNT(w.{column}) AS {column}_count, COALESCE(SUM(w.{column}), 0) AS {column}_sum, "
+                          f"COALESCE(SUM(w.{column} * (d.month * 32 + d.day)), 0) AS {column}_weighted"
+                          for column in measure_columns)
+    return f"""
+    SELECT w.station_id, d.year, COUNT(*) AS row_count, SUM(d.month * 32 + d.day) AS date_checksum, {checksums}
+    FROM WeatherFact w
+    JOIN DateDim d ON w.date_id = d.date_id
+    GROUP BY w.station_id, d.year
+    """
+
+
+def compare_checksums(source, warehouse, rtol=1e-7):
+    # Partitions à recharger : absentes de l'entrepôt ('missing'), absentes de la source ('extra') ou dont un
+    # agrégat diffère ('mismatch'). Effectifs et clés de date sont entiers ; les sommes sont comparées à rtol près
+    # (ordre de sommation différent côté base)
+    columns = list(source.columns)
+    both = source.join(warehouse[columns], how='outer', lsuffix='_source', rsuffix='_warehouse')
+    in_source = both['row_count_source'].notna().to_numpy()
+    in_warehouse = both['row_count_warehouse'].notna().to_numpy()
+    differing = {}
+    for column in columns:
+        source_values = both[f'{column}_source'].to_numpy(np.float64)
+        warehouse_values = both[f'{column}_warehouse'].to_numpy(np.float64)
+        if column.endswith(('_sum', '_weighted')):
+            differing[column] = ~np.isclose(source_values, warehouse_values, rtol=rtol, atol=1e-6)
+        else:
+            differing[column] = source_values != warehouse_values
+    mismatch = np.logical_or.reduce(list(differing.values())) & in_source & in_warehouse
+    status = np.select([~in_warehouse, ~in_source, mismatch], ['missing', 'extra', 'mismatch'], default='')
+    report = pd.DataFrame({'status': status,
+                           'source_rows': both['row_count_source'].fillna(0).astype(np.int64).to_numpy(),
+                           'warehouse_rows': both['row_count_warehouse'].fillna(0).astype(np.int64).to_numpy(),
+                           'columns': [", ".join(column for column in columns if differing[column][position])
+                                       if mismatch[position] else "" for position in range(len(both))]},
+                          index=both.index)
+    return report[report['status'] != ''].reset_index()
@@ -0,0 +1,85 @@
+"""Compare MySQL et DuckDB/Parquet sur les requêtes réelles du tableau de bord.
+
+L'export Parquet doit exister (DataWarehouseManager.export_parquet ou --export).
+
+Exemple :
+    python benchmarks/backend_benchmark.py --parquet-dir parquet_warehouse --repeat 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+import pymysql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from App import build_barchart_query, build_heatmap_query, build_last_year_query, build_line_query, line_day_years
+from Backend import DuckDBBackend, MySQLBackend
+from Model import DataWarehouseManager
+
+
+def dashboard_queries(backend):
+    years = backend.query("SELECT MIN(year) AS first_year, MAX(year) AS last_year FROM DateDim")[0]
+    first_year, last_year = int(years['first_year']), int(years['last_year'])
+    stations = backend.dimension_index().stations
+    country_station_ids = stations.in_country(stations.station_country[0])
+    # Granularité jour : même fenêtre de dates que fetch_line_data
+    last_year = backend.query(build_last_year_query('TMAX', country_station_ids))[0]['last_year']
+    day_ranges = (backend.dimension_index().dates.id_ranges(line_day_years(int(last_year)))
+                  if last_year is not None else [])
+    return {
+        'heatmap (toutes années)': build_heatmap_query('TAVG', (first_year, last_year), (1, 12)),
+        'heatmap (5 ans, été)': build_heatmap_query('TAVG', (max(first_year, last_year - 4), last_year), (6, 8)),
+        'barchart (toutes années)': build_barchart_query((first_year, last_year), (1, 12), 'PRCP'),
+        'barchart (pays)': build_barchart_query((first_year, last_year), (1, 12), 'PRCP', country_station_ids),
+        'line par année': build_line_query(None, 'TMAX', 'year'),
+        'line par mois (pays)': build_line_query(country_station_ids, 'TMAX', 'month'),
+        'line par jour (pays)': build_line_query(country_station_ids, 'TMAX', 'day', day_ranges),
+    }
+
+
+def time_query(backend, query, repeat):
+    backend.query(query)  # Préchauffage (plan, cache de pages)
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        backend.query(query)
+        durations.append(time.perf_counter() - start_time)
+    return statistics.median(durations) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--parquet-dir', default='parquet_warehouse')
+    parser.add_argument('--export', action='store_true', help="Exporter l'entrepôt MySQL en Parquet avant la mesure")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', default='Weather_DataWarehouse')
+    args = parser.parse_args()
+
+    warehouse = DataWarehouseManager(args.host, args.user, args.password, args.database, 'utf8mb4',
+                                     pymysql.cursors.DictCursor)
+    if args.export:
+        warehouse.connect()
+        warehouse.export_parquet(args.parquet_dir)
+        warehouse.disconnect()
+    backends = [MySQLBackend(warehouse), DuckDBBackend(args.parquet_dir)]
+
+    results = []
+    for name, query in dashboard_queries(backends[0]).items():
+        row = {'requête': name}
+        for backend in backends:
+            row[f'{backend.name}_ms'] = time_query(backend, query, args.repeat)
+        row['accélération'] = row['mysql_ms'] / row['duckdb_ms']
+        results.append(row)
+
+    print(pd.DataFrame(results).to_string(index=False, float_format='%.1f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Vérifie par EXPLAIN que les requêtes du tableau de bord utilisent les index de l'entrepôt.
+
+Le script échoue (code 1) si une requête parcourt entièrement une table où un index est attendu, ou si
+l'index retenu ne couvre pas la requête (relecture des lignes par la clé primaire).
+
+Exemple :
+    python benchmarks/explain_dashboard_queries.py --database Weather_DataWarehouse
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+import pymysql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from App import build_barchart_query, build_heatmap_query, build_last_year_query, build_line_query, line_day_years
+from Model import DataWarehouseManager
+
+# Tables dont le parcours complet trahit un index manquant ; les dimensions sont assez petites pour être lues entières
+INDEXED_TABLES = {'w', 'WeatherFact', 'a', 'WeatherMonthlyAgg'}
+
+
+def dashboard_queries(warehouse):
+    years = warehouse._select_frame("SELECT MIN(year) AS first_year, MAX(year) AS last_year FROM DateDim")
+    first_year, last_year = int(years['first_year'][0]), int(years['last_year'][0])
+    narrow_years = (max(first_year, last_year - 4), last_year)
+    stations = warehouse.dimension_index().stations
+    country_station_ids = stations.in_country(stations.station_country[0])
+    # Même fenêtre que fetch_line_data pour la granularité jour : la requête expliquée est celle du tableau de bord
+    last_year = warehouse._select_frame(build_last_year_query('TMAX', country_station_ids))['last_year'][0]
+    day_ranges = warehouse.date_index().id_ranges(line_day_years(int(last_year))) if pd.notna(last_year) else []
+    return {
+        'heatmap (5 ans, été)': build_heatmap_query('TAVG', narrow_years, (6, 8)),
+        'heatmap (fenêtre)': build_heatmap_query('TAVG', narrow_years, (1, 12), stations.in_bbox(-10, 30, 20, 55)),
+        'barchart (5 ans, pays)': build_barchart_query(narrow_years, (1, 12), 'PRCP', country_station_ids),
+        'line par année (pays)': build_line_query(country_station_ids, 'TMAX', 'year'),
+        'line par mois (pays)': build_line_query(country_station_ids, 'TMAX', 'month'),
+        'line fenêtre jour (pays)': build_last_year_query('TMAX', country_station_ids),
+        'line par jour (pays)': build_line_query(country_station_ids, 'TMAX', 'day', day_ranges),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', default='Weather_DataWarehouse')
+    args = parser.parse_args()
+
+    warehouse = DataWarehouseManager(args.host, args.user, args.password, args.database, 'utf8mb4',
+                                     pymysql.cursors.DictCursor)
+    warehouse.connect()
+    failures = []
+    for name, query in dashboard_queries(warehouse).items():
+        plan = warehouse.explain_query(query)
+        print(f"\n--- {name}")
+        print(plan.to_string(index=False))
+        indexed = plan[plan['table'].isin(INDEXED_TABLES)]
+        # Index couvrant ('Using index') ou clé primaire InnoDB, qui porte déjà toute la ligne
+        covered = indexed['Extra'].fillna('').str.contains('Using index') | (indexed['key'] == 'PRIMARY')
+        if (indexed['type'] == 'ALL').any() or not covered.all():
+            failures.append(name)
+    warehouse.disconnect()
+
+    if failures:
+        print(f"\nParcours complets ou index non couvrants : {', '.join(failures)}")
+        sys.exit(1)
+    print("\nToutes les requêtes du tableau de bord utilisent un index couvrant.")
+
+
+if __name__ == '__main__':
+    pd.set_option('display.width', 200)
+    main()
@@ -0,0 +1,72 @@
+"""Mesure de la mémoire maximale du chargement en flux selon la taille du fichier CSV.
+
+Exemple :
+    python benchmarks/memory_benchmark.py --stations 200 --years 2 10 40 --chunksize 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import pymysql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model import DataWarehouseManager
+from synthetic_data import generate_weather_csv
+
+
+def reset_database(args):
+    conn = pymysql.connect(host=args.host, user=args.user, password=args.password)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {args.database}")
+        cursor.execute(f"CREATE DATABASE {args.database}")
+    conn.close()
+
+
+def measure(args, csv_file):
+    reset_database(args)
+    warehouse = DataWarehouseManager(args.host, args.user, args.password, args.database, 'utf8mb4',
+                                     pymysql.cursors.Cursor)
+    warehouse.connect()
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    warehouse.load_data_warehouse(csv_file, bulk=True, batch_size=args.batch_size, chunksize=args.chunksize)
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    warehouse.disconnect()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=200)
+    parser.add_argument('--years', type=int, nargs='+', default=[2, 20], help="Échelles à comparer (années)")
+    parser.add_argument('--chunksize', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', default='Weather_DataWarehouse_Bench')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for years in args.years:
+            csv_file = os.path.join(tmp_dir, f'synthetic_{years}.csv')
+            rows = generate_weather_csv(csv_file, args.stations, years)
+            elapsed, peak = measure(args, csv_file)
+            results.append({'rows': rows, 'file_mb': os.path.getsize(csv_file) / 2 ** 20,
+                            'peak_mb': peak / 2 ** 20, 'seconds': elapsed})
+            os.remove(csv_file)
+
+    print(f"\nchunksize = {args.chunksize}")
+    print(pd.DataFrame(results).to_string(index=False, float_format='%.1f'))
+
+
+if __name__ == '__main__':
+    main()
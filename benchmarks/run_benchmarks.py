@@ -0,0 +1,197 @@
+"""Banc d'essai complet : chargement ETL phase par phase, requêtes du tableau de bord et construction des figures.
+
+Un jeu de données synthétique (benchmarks/synthetic_data.py) est chargé dans MySQL (base recréée) par
+DataWarehouseManager.load_data_warehouse, dont les phases sont chronométrées. Les requêtes passent ensuite par
+MySQL ou par le moteur embarqué DuckDB, sur l'export Parquet écrit par ce même chargement. --parquet-dir mesure
+seulement les requêtes, sur un export existant (aucun serveur requis). Les résultats sont écrits en JSON pour être
+comparés d'une version à l'autre.
+
+Exemples :
+    python benchmarks/run_benchmarks.py --backend mysql --stations 200 --years 30 --repeat 5
+    python benchmarks/run_benchmarks.py --backend duckdb --stations 100 --years 10 --output results.json
+    python benchmarks/run_benchmarks.py --backend duckdb --snapshot   # lectures sur l'instantané mmap des faits
+    python benchmarks/run_benchmarks.py --parquet-dir parquet_warehouse   # export existant, sans chargement
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+import pymysql
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from Model import DataWarehouseManager
+from Snapshot import SnapshotReader
+from synthetic_data import generate_weather_csv
+
+
+def reset_database(args):
+    conn = pymysql.connect(host=args.host, user=args.user, password=args.password)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {args.database}")
+        cursor.execute(f"CREATE DATABASE {args.database}")
+    conn.close()
+
+
+def load_mysql(args, csv_file, parquet_dir=None, snapshot_dir=None):
+    # Le chargement réel de Model.py ; l'export Parquet et l'instantané en sont des phases
+    reset_database(args)
+    warehouse = DataWarehouseManager(args.host, args.user, args.password, args.database, 'utf8mb4',
+                                     pymysql.cursors.DictCursor)
+    warehouse.connect()
+    warehouse.load_data_warehouse(csv_file, bulk=True, batch_size=args.batch_size, chunksize=args.chunksize,
+                                  workers=args.workers, parquet_dir=parquet_dir, snapshot_dir=snapshot_dir,
+                                  verify=args.verify)
+    warehouse.disconnect()
+    return warehouse, dict(warehouse.phase_timings)
+
+
+def median_ms(func, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start_time)
+    return statistics.median(durations) * 1000, result
+
+
+def benchmark_queries(App, repeat):
+    # Fonctions de lecture appelées sans le cache (__wrapped__) : on mesure la requête et la mise en forme
+    years = App.fetch_dimension_metadata.__wrapped__()['years']
+    countries = App.fetch_dimension_metadata.__wrapped__()['countries']
+    first_year, last_year = int(years[0]), int(years[-1])
+    narrow_years = (max(first_year, last_year - 4), last_year)
+    country = countries[0] if countries else None
+    # Fenêtre de carte sur l'Europe, au format relayoutData de Plotly
+    viewport = {'mapbox._derived': {'coordinates': [[-10, 60], [30, 60], [30, 35], [-10, 35]]}}
+    cases = {
+        'fetch_years': lambda: (App.query_cache.invalidate(), App.fetch_years())[1],
+        'heatmap (toutes années)': lambda: App.fetch_data_heatmap.__wrapped__('TAVG', (first_year, last_year),
+                                                                              (1, 12)),
+        'heatmap (5 ans, été)': lambda: App.fetch_data_heatmap.__wrapped__('TAVG', narrow_years, (6, 8)),
+        'heatmap (fenêtre)': lambda: App.fetch_data_heatmap.__wrapped__('TAVG', (first_year, last_year), (1, 12),
+                                                                        App.viewport_bounds(viewport)),
+        'barchart (toutes années)': lambda: App.fetch_data_barchart.__wrapped__((first_year, last_year), (1, 12),
+                                                                                'PRCP'),
+        'barchart (pays)': lambda: App.fetch_data_barchart.__wrapped__((first_year, last_year), (1, 12), 'PRCP',
+                                                                       country),
+        'line par année': lambda: App.fetch_line_data.__wrapped__(None, 'TMAX', 'year'),
+        'line par mois (pays)': lambda: App.fetch_line_data.__wrapped__(country, 'TMAX', 'month'),
+        'line par jour (pays)': lambda: App.fetch_line_data.__wrapped__(country, 'TMAX', 'day'),
+        'anomalies (mois)': lambda: App.fetch_anomaly_data.__wrapped__('TAVG', last_year, 7),
+    }
+    results = []
+    for name, case in cases.items():
+        case()  # Préchauffage (plan, cache de pages, vues)
+        ms, result = median_ms(case, repeat)
+        results.append({'name': name, 'median_ms': ms, 'rows': len(result)})
+    callbacks = {
+        'update_heatmap': lambda: App.update_heatmap('TAVG', [first_year, last_year], [1, 12], None),
+        'update_heatmap (fenêtre)': lambda: App.update_heatmap('TAVG', [first_year, last_year], [1, 12], viewport),
+        'update_heatmap (cellules)': lambda: App.update_heatmap('TAVG', [first_year, last_year], [1, 12], None,
+                                                                'cells'),
+        'update_bar_chart': lambda: App.update_bar_chart([first_year, last_year], [1, 12], 'PRCP', country),
+        'update_graph (année)': lambda: App.update_graph('TMAX', None, 'year'),
+        'update_graph (jour)': lambda: App.update_graph('TMAX', country, 'day'),
+        'update_anomaly_map': lambda: App.update_anomaly_map('TAVG', last_year, 7, None),
+    }
+    figures = []
+    for name, callback in callbacks.items():
+        # Premier appel hors mesure : le cache est chaud, seule la construction de la figure est chronométrée
+        figure = callback()
+        ms, figure = median_ms(callback, repeat)
+        serialize_ms, payload = median_ms(figure.to_json, repeat)
+        figures.append({'name': name, 'build_ms': ms, 'serialize_ms': serialize_ms, 'payload_bytes': len(payload)})
+    return results, figures
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['mysql', 'duckdb'], default='duckdb')
+    parser.add_argument('--stations', type=int, default=100)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunksize', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--verify', action='store_true',
+                        help="MySQL : rapprocher le CSV et l'entrepôt après le chargement (phase verify)")
+    parser.add_argument('--snapshot', action='store_true',
+                        help="Écrire l'instantané mmap des faits et servir les agrégations depuis celui-ci")
+    parser.add_argument('--parquet-dir',
+                        help="Export Parquet existant (export_parquet) : requêtes DuckDB seules, sans chargement")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--database', default='Weather_DataWarehouse_Bench')
+    args = parser.parse_args()
+    if args.parquet_dir and (args.backend == 'mysql' or args.snapshot):
+        parser.error("--parquet-dir interroge un export existant avec DuckDB, sans --backend mysql ni --snapshot")
+
+    import App
+    from Backend import DuckDBBackend, MySQLBackend
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rows, phases = None, None
+        snapshot_dir = os.path.join(tmp_dir, 'snapshot') if args.snapshot else None
+        if args.parquet_dir:
+            App.backend = DuckDBBackend(args.parquet_dir)
+        else:
+            csv_file = os.path.join(tmp_dir, 'synthetic.csv')
+            rows = generate_weather_csv(csv_file, args.stations, args.years, seed=args.seed)
+            print(f"{rows} lignes synthétiques ({os.path.getsize(csv_file) / 2 ** 20:.1f} Mo)")
+            parquet_dir = os.path.join(tmp_dir, 'parquet') if args.backend == 'duckdb' else None
+            warehouse, phases = load_mysql(args, csv_file, parquet_dir, snapshot_dir)
+            App.warehouse = warehouse
+            App.backend = DuckDBBackend(parquet_dir) if parquet_dir else MySQLBackend(warehouse)
+        App.snapshots = SnapshotReader(snapshot_dir) if snapshot_dir else None
+        App.query_cache.version_source = App.snapshots.load_version if App.snapshots else App.backend.load_version
+        App.query_cache.invalidate()
+        queries, figures = benchmark_queries(App, args.repeat)
+
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'config': dict(vars(args), password=None, rows=rows),
+        # Durées de load_data_warehouse (None avec --parquet-dir : aucun chargement)
+        'etl_phases_s': phases,
+        'etl_rows_per_s': rows / phases['total'] if phases and phases.get('total') else None,
+        'queries': queries,
+        'figures': figures,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+
+    if phases:
+        print("\nPhases ETL de load_data_warehouse (s)")
+        print(pd.Series(phases).to_string(float_format='%.2f'))
+    print("\nRequêtes (sans cache)")
+    print(pd.DataFrame(queries).to_string(index=False, float_format='%.1f'))
+    print("\nFigures (cache chaud)")
+    print(pd.DataFrame(figures).to_string(index=False, float_format='%.1f'))
+    print(f"\nRésultats écrits dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
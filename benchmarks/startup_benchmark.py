@@ -0,0 +1,50 @@
+"""Temps de démarrage d'un worker du tableau de bord : import de App.py puis premier et second rendu du layout.
+
+Chaque mesure est faite dans un processus neuf, comme un worker gunicorn qui démarre.
+
+Exemple :
+    python benchmarks/startup_benchmark.py --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import App
+imported = time.perf_counter()
+App.serve_layout()
+first_layout = time.perf_counter()
+App.serve_layout()
+second_layout = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'first_layout_s': first_layout - imported,
+                  'second_layout_s': second_layout - first_layout,
+                  'connections_opened': App.warehouse.pool_metrics()['open']}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    df = pd.DataFrame(results)
+    print(df.to_string(index=False, float_format='%.3f'))
+    print('\nMédiane :')
+    print(df.median().to_string(float_format='%.3f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Générateur reproductible de données météo au format de Ready_Data.csv (stations x années, une ligne par jour).
+
+Exemple :
+    python benchmarks/synthetic_data.py synthetic.csv --stations 200 --years 30
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Model import DATE_COLUMNS, MEASURE_COLUMNS, STATION_COLUMNS
+
+COUNTRIES = ['Algeria', 'France', 'Spain', 'Italy', 'Germany', 'Morocco', 'Tunisia', 'Portugal', 'Canada',
+             'United States', 'Japan', 'Brazil']
+
+
+def synthetic_stations(stations, rng):
+    numbers = np.arange(stations)
+    latitude = rng.uniform(-50, 70, stations).round(4)
+    return pd.DataFrame({'STATIONCODE': [f'SYN{number:07d}' for number in numbers],
+                         'STATIONCITY': [f'City {number:05d}' for number in numbers],
+                         'STATIONCOUNTRY': [COUNTRIES[number % len(COUNTRIES)] for number in numbers],
+                         'LATITUDE': latitude, 'LONGITUDE': rng.uniform(-170, 170, stations).round(4),
+                         'ELEVATION': rng.uniform(0, 2500, stations).round(1)})
+
+
+def synthetic_year(stations_df, year, rng, missing_rate):
+    # Toutes les stations x tous les jours de l'année, avec un cycle saisonnier dépendant de la latitude
+    days = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='D')
+    station_count, day_count = len(stations_df), len(days)
+    df = stations_df.loc[np.repeat(np.arange(station_count), day_count)].reset_index(drop=True)
+    df['DAY'] = np.tile(days.day, station_count)
+    df['MONTH'] = np.tile(days.month, station_count)
+    df['YEAR'] = year
+    size = len(df)
+    latitude = df['LATITUDE'].to_numpy()
+    season = np.cos(2 * np.pi * (np.tile(days.dayofyear, station_count) - 200) / 365.25) * np.sign(latitude)
+    tavg = 27 - 0.4 * np.abs(latitude) + 10 * season + rng.normal(0, 3, size)
+    wet = rng.random(size) < 0.3
+    prcp = np.where(wet, rng.exponential(6, size), 0.0)
+    snow = np.where(wet & (tavg < 0), prcp * 10, 0.0)
+    measures = {'PRCP': prcp, 'TAVG': tavg, 'TMAX': tavg + rng.uniform(2, 9, size),
+                'TMIN': tavg - rng.uniform(2, 9, size), 'SNWD': np.where(tavg < 0, rng.uniform(0, 400, size), 0.0),
+                'PGTM': rng.integers(0, 2400, size).astype(float), 'SNOW': snow,
+                'WDFG': rng.integers(0, 36, size) * 10.0, 'WSFG': rng.gamma(4, 3, size)}
+    for column in MEASURE_COLUMNS:
+        df[column] = np.where(rng.random(size) < missing_rate, np.nan, np.round(measures[column], 1))
+    return df[DATE_COLUMNS + STATION_COLUMNS + MEASURE_COLUMNS]
+
+
+def generate_weather_csv(path, stations=100, years=10, first_year=1990, missing_rate=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    stations_df = synthetic_stations(stations, rng)
+    rows = 0
+    # Une année à la fois : la mémoire dépend du nombre de stations, pas de l'échelle totale
+    for offset in range(years):
+        df = synthetic_year(stations_df, first_year + offset, rng, missing_rate)
+        df.to_csv(path, mode='a' if offset else 'w', header=not offset, index=False)
+        rows += len(df)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--stations', type=int, default=100)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--first-year', type=int, default=1990)
+    parser.add_argument('--missing-rate', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rows = generate_weather_csv(args.path, args.stations, args.years, args.first_year, args.missing_rate, args.seed)
+    print(f"{rows} lignes écrites dans {args.path}")
+
+
+if __name__ == '__main__':
+    main()